@@ -3,6 +3,15 @@ import os
 import shutil
 import pandas as pd
 from src.agent import ExcelAgent
+from src.artifacts import ArtifactStore
+
+# Callable download data (built only when clicked) needs Streamlit >= 1.52;
+# older releases - or an unparseable version - get the CSV bytes up front
+try:
+    from packaging.version import Version
+    DEFERRED_DOWNLOADS = Version(st.__version__) >= Version("1.52.0")
+except Exception:
+    DEFERRED_DOWNLOADS = False
 
 st.set_page_config(page_title="Availability Data Excel Agent", page_icon="📊", layout="wide")
 
@@ -10,7 +19,50 @@ st.set_page_config(page_title="Availability Data Excel Agent", page_icon="📊",
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "agent" not in st.session_state:
+    # Cheap per session: the loaded data lives in a process-wide registry
+    # shared by all sessions; the agent itself only keeps the chat history
     st.session_state.agent = ExcelAgent("data")
+if "artifacts" not in st.session_state:
+    # Charts/tables from the chat, serialized once (AGENT_SESSION_ARTIFACT_MB budget)
+    st.session_state.artifacts = ArtifactStore()
+
+def render_artifact(artifact_id):
+    """
+    Draws a stored chart or table. Tables are shown one page at a time,
+    with the CSV built only when the download is clicked (where Streamlit
+    supports it).
+    """
+    store = st.session_state.artifacts
+    entry = store.get(artifact_id)
+    if entry is None:
+        st.caption("This result was dropped to save memory. Ask the question again to regenerate it.")
+        return
+    
+    # 1. Charts
+    if entry["kind"] == "png":
+        st.image(entry["data"])
+    elif entry["kind"] == "plotly":
+        import plotly.io as pio
+        st.plotly_chart(pio.from_json(entry["data"].decode("utf-8")), key=f"chart_{artifact_id}")
+    # 2. Tables
+    else:
+        pages = store.pages(artifact_id)
+        page = 1
+        if pages > 1:
+            page = st.number_input(
+                f"Page (of {pages}, {entry['rows']} rows)", min_value=1, max_value=pages, value=1,
+                key=f"page_{artifact_id}",
+            )
+        st.dataframe(store.table_page(artifact_id, page - 1))
+        
+        # CSV Download
+        st.download_button(
+            label="Download as CSV",
+            data=(lambda: store.table_csv(artifact_id)) if DEFERRED_DOWNLOADS else store.table_csv(artifact_id),
+            file_name='agent_data_export.csv',
+            mime='text/csv',
+            key=f"csv_{artifact_id}",
+        )
 
 def main():
     st.title("Availability Data Excel Agent")
@@ -34,33 +86,47 @@ def main():
                 
                 st.success(f"Saved: {uploaded_file.name}")
                 
-                # Reload Agent
-                msg = st.session_state.agent.load_data()
+                # Ingest just the new file (other weeks stay loaded)
+                if not st.session_state.agent.dataset.loaded:
+                    msg = st.session_state.agent.load_data()
+                else:
+                    msg = st.session_state.agent.add_file(file_path)
                 st.info(msg)
                 
                 # Force rerun to update UI state
                 st.rerun()
             else:
                 st.info(f"File '{uploaded_file.name}' already loaded.")
-
-            st.session_state.agent.df = None
-            st.rerun()
             
         if st.checkbox("Run Data Health Check"):
-            if st.session_state.agent.df is not None:
+            if st.session_state.agent.dataset.loaded:
                 issues = st.session_state.agent.check_data_quality()
                 for issue in issues:
                     if "âœ…" in issue:
                         st.success(issue)
                     else:
                         st.warning(issue)
+        
+        # Per-stage latency over recent questions (see AGENT_TRACE_LOG for the full spans)
+        with st.expander("Latency Metrics"):
+            stats = st.session_state.agent.tracer.stats()
+            if stats:
+                metrics = pd.DataFrame.from_dict(stats, orient="index")
+                st.dataframe(metrics[["count", "p50_ms", "p95_ms", "max_ms"]])
+            else:
+                st.caption("No questions answered yet.")
+            artifacts = st.session_state.artifacts.stats()
+            st.caption(
+                f"Chat artifacts: {artifacts['artifacts']} ({artifacts['used_mb']} / {artifacts['budget_mb']} MB, "
+                f"{artifacts['evicted']} evicted)"
+            )
 
     # Main Chat Interface
     
     # Init agent if not loaded
-    if st.session_state.agent.df is None:
-        # Try loading defaults
-        msg = st.session_state.agent.load_data()
+    if not st.session_state.agent.dataset.loaded:
+        # Try loading defaults (sessions opened together load once; the rest reuse it)
+        msg = st.session_state.agent.load_data(reload=False)
         if "Error" in msg and "No Excel file" in msg:
             st.warning("Please upload an Excel file to begin.")
         else:
@@ -69,21 +135,11 @@ def main():
     # Display Chat History
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
-            content = msg["content"]
-            
-            # Handle different content types
-            # 1. Charts
-            if hasattr(content, 'figure') or hasattr(content, 'show'):
-                 try:
-                    st.pyplot(content)
-                 except:
-                    st.plotly_chart(content)
-            # 2. DataFrames
-            elif isinstance(content, (pd.DataFrame, pd.Series)):
-                 st.dataframe(content)
-            # 3. Text
+            # Charts / tables come from the artifact store, text is kept inline
+            if msg.get("artifact"):
+                 render_artifact(msg["artifact"])
             else:
-                 st.markdown(content)
+                 st.markdown(msg["content"])
                  
             # Show explanation if exists and is assistant
             if msg["role"] == "assistant" and "explanation" in msg:
@@ -100,49 +156,38 @@ def main():
         # Generate Response
         with st.chat_message("assistant"):
             with st.spinner("Analyzing..."):
-                response_dict = st.session_state.agent.run(prompt)
+                # Show the code as it streams in
+                code_placeholder = st.empty()
+                
+                def show_partial_code(code):
+                    code_placeholder.code(code or "# Generating...", language="python")
+                
+                response_dict = st.session_state.agent.run(prompt, on_chunk=show_partial_code)
+                code_placeholder.empty()
                 result = response_dict["result"]
                 explanation = response_dict["explanation"]
                 
-                # Handle different result types
-                # 1. Charts (Matplotlib / Plotly)
-                if hasattr(result, 'figure') or hasattr(result, 'show'): 
-                    # Heuristic for plotly/matplotlib figures
-                    try:
-                        st.pyplot(result)
-                    except:
-                        st.plotly_chart(result)
-                    st.write(explanation)
-                    
-                # 2. DataFrames / Lists (Exportable)
-                elif isinstance(result, (pd.DataFrame, pd.Series, list)):
-                    if isinstance(result, list):
-                        result = pd.DataFrame(result)
-                    
-                    st.dataframe(result)
-                    
-                    # CSV Download
-                    csv = result.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="Download as CSV",
-                        data=csv,
-                        file_name='agent_data_export.csv',
-                        mime='text/csv',
-                    )
+                # Charts (Matplotlib / Plotly) and DataFrames / Lists are serialized
+                # once into the artifact store; the live objects are not kept
+                artifact_id = st.session_state.artifacts.put(result)
+                if artifact_id is not None:
+                    render_artifact(artifact_id)
                     st.write(f"Explanation: {explanation}")
+                    content = f"[{type(result).__name__} result]"
                     
-                # 3. Standard Text / String
+                # Standard Text / String
                 else:
-                    st.markdown(result)
+                    content = str(result)
+                    st.markdown(content)
                     if explanation:
                         with st.expander("Show Verification Steps"):
                             st.info(explanation)
             
-            # Save to history (store string rep for now to avoid pickle issues if needed, or just store object)
-            # Storing object in session state is fine.
+            # Save to history: text inline, charts/tables by artifact id
             st.session_state.messages.append({
                 "role": "assistant", 
-                "content": result,
+                "content": content,
+                "artifact": artifact_id,
                 "explanation": explanation
             })
 
@@ -0,0 +1,210 @@
+"""
+Offline benchmark suite for ExcelAgent.
+
+Generates synthetic Availability Tracker workbooks, swaps the Gemini model for
+a stub that replays golden-library code, and times each pipeline stage.
+No API key or network access is needed.
+
+Usage:
+    python -m benchmarks.run_benchmarks [--rows 2000] [--weeks 8] [--repeat 5] [--out results.json]
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+import pandas as pd
+
+from src.agent import ExcelAgent
+from src.prompts import GOLDEN_QUERIES, get_few_shot_examples
+from src.ratelimit import RateLimiter
+from .synthetic import generate_trackers
+from .stub_model import StubModel
+
+QUESTIONS = [
+    "How many employees are in Bengaluru?",
+    "Count of non-billable employees in Delhi",
+    "Compare available employees in Mumbai with last week",
+    "Show the designation wise headcount as a chart",
+    "Which managers have the most available reportees?",
+    "How many interns joined this year?",
+]
+
+# Fast-path answers checked against pandas: (question, report index, filter on that report)
+FAST_PATH_CHECKS = [
+    ("How many interns?", -1, lambda df: df['category'] == 'INTERN'),
+    ("How many interns last week?", -2, lambda df: df['category'] == 'INTERN'),
+    ("Bench strength last week", -2, lambda df: df['spine_current_status'] == 'Available'),
+    ("How many consultants in Delhi last week?", -2,
+     lambda df: (df['designation'] == 'Consultant') & (df['location_group'] == 'Delhi')),
+    ("How many people in NCR?", -1, lambda df: df['location_group'].isin(['Delhi', 'Gurgaon', 'Noida'])),
+]
+
+def _timed(fn, repeat=5, setup=None):
+    """
+    Runs fn `repeat` times. Returns (timing summary in ms, last return value).
+    """
+    times = []
+    value = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        value = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    summary = {
+        "repeat": repeat,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.mean(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+    return summary, value
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def check_fast_path(agent):
+    """
+    Runs FAST_PATH_CHECKS through the agent. Returns {question: {result,
+    expected, error}}; error is set when the leading number of the answer
+    doesn't match the count computed directly on the report.
+    """
+    dates = list(agent.partitions)
+    checks = {}
+    for question, index, condition in FAST_PATH_CHECKS:
+        if len(dates) < -index:
+            continue
+        snap = agent.snapshot(dates[index])
+        expected = int(snap.loc[condition(snap), 'employee_id'].nunique())
+        agent.chat_history.clear()
+        result = agent.run(question)["result"]
+        found = re.search(r"-?\d+", str(result))
+        error = None if found and int(found.group(0)) == expected else f"expected {expected}"
+        checks[question] = {"result": str(result), "expected": expected, "error": error}
+    return checks
+
+def make_agent(data_dir, **kwargs):
+    """
+    ExcelAgent wired to the stub model and an unlimited rate limiter.
+    """
+    agent = ExcelAgent(data_dir=data_dir, **kwargs)
+    agent.model = StubModel()
+    agent.rate_limiter = RateLimiter(rpm=0, tpm=0)
+    return agent
+
+def run_benchmarks(rows=2000, weeks=8, repeat=5, workdir=None, keep_data=False):
+    workdir = workdir or tempfile.mkdtemp(prefix="agent_bench_")
+    data_dir = os.path.join(workdir, "data")
+    cache_dir = os.path.join(data_dir, ".cache")
+
+    results = {
+        "config": {"rows": rows, "weeks": weeks, "repeat": repeat},
+        "environment": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+        },
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "scenarios": {},
+    }
+    scenarios = results["scenarios"]
+
+    try:
+        # 0. Synthetic workbooks
+        start = time.perf_counter()
+        generate_trackers(data_dir, rows=rows, weeks=weeks, fallback_sheet_every=4)
+        results["generate_s"] = round(time.perf_counter() - start, 3)
+
+        # 1. Loading: cold (no parsed-workbook cache) vs warm
+        agent = make_agent(data_dir)
+        clear_cache = lambda: shutil.rmtree(cache_dir, ignore_errors=True)
+        scenarios["load_data_cold"], _ = _timed(agent.load_data, repeat, setup=clear_cache)
+        scenarios["load_data_warm"], _ = _timed(agent.load_data, repeat)
+        scenarios["load_data_cold"]["rows"] = len(agent.df)
+        scenarios["load_data_warm"]["memory"] = agent.memory_report
+
+        # 2. Context and data quality
+        scenarios["prepare_context"], _ = _timed(agent.dataset._prepare_context, repeat)
+        scenarios["check_data_quality"], _ = _timed(agent.check_data_quality, repeat)
+
+        # 3. Few-shot retrieval
+        search_all = lambda: [get_few_shot_examples(q) for q in QUESTIONS]
+        scenarios["get_few_shot_examples"], _ = _timed(search_all, repeat)
+        scenarios["get_few_shot_examples"]["questions"] = len(QUESTIONS)
+
+        # 4. Executing the golden-library code
+        golden = {}
+        for ex in GOLDEN_QUERIES:
+            summary, (result, _) = _timed(lambda: agent.execute_code(ex["code"]), repeat)
+            summary["error"] = str(result) if str(result).startswith("Error:") else None
+            golden[ex["q"]] = summary
+        scenarios["execute_code_golden"] = golden
+        results["fast_path_checks"] = check_fast_path(agent)
+
+        # 5. End to end through the stub model (no fast path, no code cache)
+        e2e = make_agent(data_dir, use_code_cache=False, fast_path_confidence=None)
+        e2e.load_data()
+        end_to_end = {}
+        for question in QUESTIONS:
+            summary, response = _timed(lambda: e2e.run(question), repeat, setup=e2e.chat_history.clear)
+            summary["error"] = str(response["result"]) if str(response["result"]).startswith("Error:") else None
+            end_to_end[question] = summary
+        scenarios["run_end_to_end"] = end_to_end
+        scenarios["run_end_to_end_model_calls"] = e2e.model.calls
+        # Per-stage breakdown from the agent's tracer
+        results["trace_stages"] = e2e.tracer.stats()
+    finally:
+        if not keep_data:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ExcelAgent benchmarks")
+    parser.add_argument("--rows", type=int, default=2000, help="employees per weekly workbook")
+    parser.add_argument("--weeks", type=int, default=8, help="number of weekly workbooks")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario")
+    parser.add_argument("--workdir", default=None, help="where to write the synthetic data (default: temp dir)")
+    parser.add_argument("--keep-data", action="store_true", help="don't delete the synthetic data afterwards")
+    parser.add_argument("--out", default=None, help="results JSON path (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.rows, args.weeks, args.repeat, args.workdir, args.keep_data)
+
+    out = args.out or os.path.join(
+        os.path.dirname(__file__), "results", f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, default=str)
+
+    print("\n--- Benchmark summary (median ms) ---")
+    for name, summary in results["scenarios"].items():
+        if isinstance(summary, dict) and "median_ms" in summary:
+            print(f"{name}: {summary['median_ms']}")
+        elif isinstance(summary, dict):
+            total = sum(s["median_ms"] for s in summary.values())
+            errors = sum(1 for s in summary.values() if s.get("error"))
+            print(f"{name}: {round(total, 3)} total over {len(summary)} ({errors} errors)")
+    checks = results.get("fast_path_checks", {})
+    failed = [q for q, c in checks.items() if c["error"]]
+    print(f"fast_path_checks: {len(checks) - len(failed)}/{len(checks)} correct" + (f" (failed: {failed})" if failed else ""))
+    print(f"Results written to {out}")
+
+if __name__ == "__main__":
+    sys.exit(main())
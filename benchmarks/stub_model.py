@@ -0,0 +1,45 @@
+import time
+import asyncio
+from src.prompts import GOLDEN_INDEX
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+class StubModel:
+    """
+    Offline stand-in for genai.GenerativeModel. Replays the golden-library
+    code closest to the question in the prompt (or `default_code`), wrapped
+    in a markdown fence like the real model, after an optional fake latency.
+    """
+    model_name = "models/stub"
+
+    def __init__(self, latency=0.0, default_code=None, chunk_size=40):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.default_code = default_code or "result = len(df_latest)\nexplanation = \"Count rows of the latest report.\""
+        self.calls = 0
+
+    def _code_for(self, prompt):
+        prompt = str(prompt)
+        marker = "## Question:"
+        question = prompt[prompt.rfind(marker) + len(marker):].strip().split("\n")[0] if marker in prompt else prompt
+        matches = GOLDEN_INDEX.search(question, k=1)
+        if matches and matches[0][2] > 0.5:
+            return matches[0][1]
+        return self.default_code
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        text = f"```python\n{self._code_for(prompt)}\n```"
+        if not stream:
+            return _Response(text)
+        return (_Response(text[i:i + self.chunk_size]) for i in range(0, len(text), self.chunk_size))
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _Response(f"```python\n{self._code_for(prompt)}\n```")
@@ -0,0 +1,99 @@
+import os
+import random
+from datetime import date, timedelta
+import pandas as pd
+
+# Raw headers as they appear in the real trackers (including the broken ID header)
+HEADERS = [
+    "Emplo+A514+A1+A1:N18", "Employee Name", "Email ID", "Designation", "Office Location",
+    "Category", "Deployment Status", "Status", "sPInE Current status", "RM Name",
+    "Date of Joining", "LWD",
+]
+
+LOCATIONS = [
+    "Bengaluru", "Bengaluru Eco space", "Delhi", "Delhi-NCR", "Gurgaon", "Mumbai",
+    "Hyderabad", "Chennai", "Pune", "Kolkata", "Noida",
+]
+DESIGNATIONS = [
+    "Analyst", "Consultant", "Senior Consultant", "Manager", "Senior Manager",
+    "Associate Director", "Director", "Intern",
+]
+SPINE_STATUSES = ["Available", "Allocated", "Partially Available"]
+
+def _employee(emp_id, rng, managers):
+    designation = rng.choices(DESIGNATIONS, weights=[20, 25, 18, 12, 8, 4, 2, 11])[0]
+    return {
+        "employee_id": emp_id,
+        "name": f"Employee {emp_id}",
+        "designation": designation,
+        "location": rng.choice(LOCATIONS),
+        "category": "INTERN" if designation == "Intern" else rng.choices(["FTE", "CONTRACT"], weights=[9, 1])[0],
+        "billable": rng.random() < 0.7,
+        "spine": rng.choices(SPINE_STATUSES, weights=[3, 6, 1])[0],
+        "manager": rng.choice(managers),
+        "doj": date(2018, 1, 1) + timedelta(days=rng.randint(0, 2500)),
+    }
+
+def _row(emp, rng):
+    return {
+        "Emplo+A514+A1+A1:N18": emp["employee_id"],
+        "Employee Name": emp["name"],
+        "Email ID": f"employee{emp['employee_id']}@example.com",
+        "Designation": emp["designation"],
+        "Office Location": emp["location"],
+        "Category": emp["category"],
+        "Deployment Status": "BILLABLE" if emp["billable"] else "NON BILLABLE",
+        "Status": "Deployed" if emp["billable"] else "Available",
+        "sPInE Current status": emp["spine"],
+        "RM Name": emp["manager"],
+        "Date of Joining": emp["doj"],
+        "LWD": None,
+    }
+
+def generate_trackers(out_dir, rows=2000, weeks=8, start=date(2025, 8, 28), churn=0.02, seed=0,
+                      fallback_sheet_every=0):
+    """
+    Writes `weeks` weekly 'AvailabilityTracker_DDMMYYYY.xlsx' files with about
+    `rows` employees each. Each week a `churn` fraction of employees leave,
+    about as many join, and a few change status/designation/location.
+    With fallback_sheet_every=N, every Nth file uses a non-default sheet name
+    to exercise the sheet fallback. Returns the written paths.
+    """
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    managers = [f"Manager {i}" for i in range(max(5, rows // 40))]
+    staff = {i: _employee(i, rng, managers) for i in range(10001, 10001 + rows)}
+    next_id = 10001 + rows
+
+    paths = []
+    for week in range(weeks):
+        report_date = start + timedelta(weeks=week)
+        if week:
+            # Leavers, joiners and attribute changes
+            for emp_id in rng.sample(sorted(staff), int(len(staff) * churn)):
+                del staff[emp_id]
+            for _ in range(int(rows * churn)):
+                staff[next_id] = _employee(next_id, rng, managers)
+                next_id += 1
+            for emp_id in rng.sample(sorted(staff), int(len(staff) * churn * 2)):
+                emp = staff[emp_id]
+                emp["billable"] = not emp["billable"]
+                emp["spine"] = rng.choice(SPINE_STATUSES)
+                if rng.random() < 0.2:
+                    emp["location"] = rng.choice(LOCATIONS)
+                if rng.random() < 0.1 and emp["designation"] != "Intern":
+                    emp["designation"] = rng.choice(DESIGNATIONS[:-1])
+
+        df = pd.DataFrame([_row(emp, rng) for emp in staff.values()], columns=HEADERS)
+        sheet = "Availability Tracker"
+        if fallback_sheet_every and week % fallback_sheet_every == fallback_sheet_every - 1:
+            sheet = "Sheet1"
+        path = os.path.join(out_dir, f"AvailabilityTracker_{report_date.strftime('%d%m%Y')}.xlsx")
+        df.to_excel(path, sheet_name=sheet, index=False)
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    import sys
+    out = sys.argv[1] if len(sys.argv) > 1 else "bench_data"
+    print(generate_trackers(out))
@@ -1,11 +1,58 @@
 from src.agent import ExcelAgent
 import sys
+import json
+import pandas as pd
+
+def to_jsonable(result):
+    """
+    Converts an agent result into something json.dumps can write.
+    """
+    if isinstance(result, pd.DataFrame):
+        return result.to_dict(orient="records")
+    if isinstance(result, pd.Series):
+        return result.to_dict()
+    if hasattr(result, 'figure') or hasattr(result, 'show'):
+        return "[chart]"
+    return result
+
+def run_batch_file(agent, in_path, out_path, concurrency=4):
+    """
+    Reads questions from a JSONL file ({"question": "..."} per line) and
+    writes one {"question", "result", "explanation"} line per question.
+    """
+    questions = []
+    with open(in_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            questions.append(item["question"] if isinstance(item, dict) else str(item))
+
+    answers = agent.run_batch(questions, concurrency=concurrency)
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        for question, answer in zip(questions, answers):
+            record = {
+                "question": question,
+                "result": to_jsonable(answer.get("result")),
+                "explanation": answer.get("explanation"),
+            }
+            f.write(json.dumps(record, default=str) + "\n")
+    print(f"Wrote {len(answers)} answers to {out_path}")
 
 def main():
     agent = ExcelAgent("data")
     print(agent.load_data())
-    
-    if len(sys.argv) > 1:
+
+    # Batch mode: python main.py --batch questions.jsonl results.jsonl [concurrency]
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        if len(sys.argv) < 4:
+            print("Usage: python main.py --batch <questions.jsonl> <results.jsonl> [concurrency]")
+            return
+        concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+        run_batch_file(agent, sys.argv[2], sys.argv[3], concurrency=concurrency)
+    elif len(sys.argv) > 1:
         question = " ".join(sys.argv[1:])
         print(f"\nQuestion: {question}")
         answer = agent.run(question)
@@ -1,24 +1,93 @@
 import pandas as pd
 import os
+import asyncio
+import datetime
+import threading
 import google.generativeai as genai
-from .utils import get_latest_file, get_all_files
-from .prompts import SYSTEM_PROMPT, ERROR_PROMPT, get_few_shot_examples
+from .utils import get_latest_file, get_all_files, parse_date_from_filename, file_signature, extract_code
+from .loader import parse_files, configured_columns, reader_key
+from .cache import FrameCache, CodeCache
+from .compact import compact_concat
+from .profiles import profile_frame
+from .registry import Dataset, get_registry
+from .history import HistoryStore
+from .warehouse import ParquetStore, HAS_DUCKDB
+from .aliases import GROUP_COLUMNS
+from .conversation import history_entry, format_history
+from .validator import validate_code
+from .fastpath import match_question, answer_match
+from .ratelimit import get_rate_limiter, estimate_tokens
+from .sandbox import ExecutionPool, LazyVars, LazyFrames, fork_available
+from .tracing import get_tracer, trace_backoff, describe_result, profile_exec
+from .prompts import GOLDEN_QUERIES, REPAIR_PROMPT, get_few_shot_examples
+from .prompt_builder import PromptBuilder, BuiltPrompt
+from .retrieval import FewShotIndex
 from dotenv import load_dotenv
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import google.api_core.exceptions
 
 load_dotenv()
 
+NO_HISTORY = "No previous chat history."
+
+# Read-only views of the shared dataset, served from the registry's current version
+DATASET_ATTRS = {
+    "df", "schema_str", "values_str", "key_values", "data_version", "report_date", "latest_date",
+    "date_range", "partitions", "load_errors", "memory_report",
+}
+
 class ExcelAgent:
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", use_cache=True, workers=None, use_code_cache=True,
+                 fast_path_confidence=0.8, exec_workers=None, exec_timeout=30, exec_memory_mb=2048,
+                 prompt_budget=None, load_columns="default", history_store=None, backend=None):
         self.data_dir = data_dir
-        self.df = None
-        self.schema_str = ""
-        self.values_str = ""
-        self.report_date = None
-        self.latest_date = None
-        self.date_range = []
-        self.chat_history = []  # List of {"role": "user/assistant", "content": "..."}
+        # Minimum match confidence for answering template questions without the LLM (None = off)
+        self.fast_path_confidence = fast_path_confidence
+        self.use_cache = use_cache
+        # Loaded data is shared by every agent (session) on this data_dir;
+        # an agent only owns its chat history
+        self.registry = get_registry(data_dir)
+        # Question -> code cache, persisted next to the parsed workbook cache
+        self.code_cache = self.registry.resource(
+            "code_cache", lambda: CodeCache(os.path.join(data_dir, ".cache", "code_cache.json"))
+        ) if use_code_cache else None
+        # Golden library + question/code pairs harvested from successful runs
+        self.few_shot_index = self.registry.resource(
+            "few_shot_index",
+            lambda: FewShotIndex.load(os.path.join(data_dir, ".cache", "few_shot.json"), seed=GOLDEN_QUERIES),
+        )
+        # Process pool size for parsing workbooks (1 = serial)
+        if workers is None:
+            workers = int(os.getenv("AGENT_LOAD_WORKERS", "1"))
+        self.workers = max(1, workers)
+        # Columns kept from each workbook (None = all, the default; projection is opt-in via AGENT_LOAD_COLUMNS)
+        self.load_columns = configured_columns() if load_columns == "default" else load_columns
+        # Keep rows as validity intervals instead of one copy per week (AGENT_HISTORY_STORE=1)
+        if history_store is None:
+            history_store = os.getenv("AGENT_HISTORY_STORE", "0") == "1"
+        self.history_store = history_store
+        # Query backend: "pandas" (frames in memory) or "duckdb" (Parquet partitions
+        # per report date, queried with SQL from generated code; AGENT_BACKEND)
+        if backend is None:
+            backend = os.getenv("AGENT_BACKEND", "pandas")
+        backend = backend.lower()
+        if backend == "duckdb" and not HAS_DUCKDB:
+            print("WARNING: AGENT_BACKEND=duckdb needs the 'duckdb' package; using the pandas backend.")
+            backend = "pandas"
+        self.backend = backend
+        self.chat_history = []  # List of {"role": "user/assistant", "content": "...", "code": "..." (assistant only)}
+        self._exec_lock = threading.Lock()
+        
+        # Isolated execution workers for generated code: on by default where fork is
+        # available (timeout + memory cap); AGENT_EXEC_WORKERS=0 runs it in-process
+        if exec_workers is None:
+            exec_workers = int(os.getenv("AGENT_EXEC_WORKERS", "2" if fork_available() else "0"))
+        if exec_workers > 0 and not fork_available():
+            print("WARNING: isolated execution needs the 'fork' start method; running generated code in-process.")
+            exec_workers = 0
+        self.exec_workers = exec_workers
+        self.exec_timeout = exec_timeout
+        self.exec_memory_mb = exec_memory_mb
         
         # Setup Gemini
         api_key = os.getenv("GEMINI_API_KEY")
@@ -27,68 +96,254 @@ class ExcelAgent:
         genai.configure(api_key=api_key)
         # User requested gemini-3-flash-preview
         self.model = genai.GenerativeModel('gemini-3-flash-preview') 
+        # Shared by every agent in the process (GEMINI_RPM / GEMINI_TPM)
+        self.rate_limiter = get_rate_limiter()
+        # Per-stage latency spans (AGENT_TRACE_LOG) + optional cProfile of generated code
+        self.tracer = get_tracer()
+        self.profile_exec = os.getenv("AGENT_PROFILE_EXEC", "0") == "1"
+        
+        # Prompt assembly: cached prefix per data version + budgeted suffix
+        if prompt_budget is None:
+            prompt_budget = int(os.getenv("AGENT_PROMPT_BUDGET", "12000"))
+        self.prompt_builder = PromptBuilder(budget=prompt_budget)
+        self.last_prompt_sizes = {}
+        # Gemini context caching of the prefix (needs a model/tier that supports it)
+        self.use_context_cache = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"
+        self._context_cache = None
+        self._context_cache_model = None
+        self._context_cache_version = None
+        self._context_cache_lock = threading.Lock()
 
-    def load_data(self):
+    def load_data(self, reload=True):
         """
         Loads ALL Excel files from data directory, adds 'report_date', and concatenates.
+        Parsed files are served from the on-disk cache when unchanged; cache misses
+        are parsed in a process pool when self.workers > 1.
+        Files that fail to parse are skipped and listed in self.load_errors.
+        The result is published as a new shared dataset version.
+        With reload=False nothing is done when the data is already loaded
+        (e.g. by another session that held the writer lock first).
+        """
+        with self.registry.writer() as current:
+            if not reload and current.loaded:
+                msg = f"Loaded {len(current.files)} files. Date Range: {min(current.date_range)} to {max(current.date_range)}."
+            else:
+                msg = self._refresh(Dataset())
+        self.chat_history = []
+        return msg
+
+    def refresh(self):
+        """
+        Incremental reload: diffs the data directory against what is already
+        loaded, parses only new or changed files and drops removed ones.
         """
-        all_files = get_all_files(self.data_dir)
+        with self.registry.writer() as current:
+            return self._refresh(current)
+
+    def _refresh(self, base):
+        source_dir = self.data_dir
+        all_files = get_all_files(source_dir)
         # Fallback to current dir if data_dir is empty checking
         if not all_files:
-            all_files = get_all_files(".")
+            source_dir = "."
+            all_files = get_all_files(source_dir)
         
-        if not all_files:
+        if not all_files and not base.files:
             return "No Excel files found."
-            
-        dfs = []
-        self.date_range = []
+        
+        current = {os.path.abspath(f['path']): f for f in all_files}
+        removed = [p for p in base.files if p not in current]
+        to_parse = [
+            f for p, f in current.items()
+            if p not in base.files or base.files[p]['signature'] != file_signature(p)
+        ]
+        if base.loaded and not to_parse and not removed:
+            return f"Data is up to date. {len(base.files)} files loaded."
+        return self._ingest(base, to_parse, removed, source_dir, live_paths=list(current))
+
+    def add_file(self, f_path):
+        """
+        Loads (or reloads) a single workbook without touching the others.
+        """
+        r_date = parse_date_from_filename(os.path.basename(f_path), filepath=f_path)
+        if not r_date:
+            return f"Error loading data: could not determine report date for {f_path}."
+        file_info = {'file': os.path.basename(f_path), 'date': r_date, 'path': f_path}
+        with self.registry.writer() as current:
+            return self._ingest(current, [file_info], [], os.path.dirname(f_path) or ".")
+
+    def remove_file(self, f_path):
+        """
+        Drops a workbook's rows from the loaded data. The file itself is left on disk.
+        """
+        key = os.path.abspath(f_path)
+        with self.registry.writer() as current:
+            if key not in current.files:
+                return f"File '{f_path}' is not loaded."
+            return self._ingest(current, [], [key], os.path.dirname(f_path) or ".")
+
+    def _ingest(self, base, to_parse, removed, source_dir, live_paths=None):
+        """
+        Applies a diff of parsed/removed files to the `base` dataset and
+        publishes the result (new df + prompt context) as the next version.
+        `base` itself is never modified. Call with the registry writer held.
+        """
+        base_files = lambda keys: [
+            {'file': base.files[k]['file'], 'date': base.files[k]['date'], 'path': base.files[k]['path']} for k in keys
+        ]
+        storage = self.storage
+        if base.loaded and base.storage != storage:
+            # Switching storage mode: rebuild everything (from the frame cache)
+            pending = {os.path.abspath(f['path']) for f in to_parse}
+            to_parse = list(to_parse) + base_files([k for k in base.files if k not in pending and k not in removed])
+            removed = []
+            base = Dataset(load_errors=base.load_errors)
+        elif base.store is not None:
+            # Stores are read back per report date, so a date that loses or
+            # replaces a file is rebuilt from all of its remaining files
+            pending = {os.path.abspath(f['path']) for f in to_parse}
+            touched = {base.files[k]['date'] for k in set(removed) | pending if k in base.files}
+            to_parse = list(to_parse) + base_files([
+                k for k, f in base.files.items() if f['date'] in touched and k not in pending and k not in removed
+            ])
+        
+        cache = FrameCache(os.path.join(source_dir, ".cache"), reader=reader_key(self.load_columns)) if self.use_cache else None
         
         try:
-            for file_info in all_files:
-                f_path = file_info['path']
-                r_date = file_info['date']
-                self.date_range.append(r_date)
-                
-                # Read - Dynamic Sheet Handling
-                # Try 'Availability Tracker', fallback to first sheet
-                try:
-                    temp_df = pd.read_excel(f_path, sheet_name="Availability Tracker")
-                except ValueError:
-                    # Sheet not found, try default
-                    temp_df = pd.read_excel(f_path, sheet_name=0)
-                
-                # Standardize Headers
-                temp_df.columns = [
-                    str(col).strip().lower()
-                    .replace(" ", "_").replace("-", "_").replace("/", "_").replace(".", "")
-                    for col in temp_df.columns
-                ]
-                
-                # Renaming bad headers
-                rename_map = {
-                    "emplo+a514+a1+a1:n18": "employee_id",
-                    "rm_name": "reporting_manager",
-                    "lwd": "last_working_day"
-                }
-                temp_df.rename(columns=rename_map, inplace=True)
-                
-                # Add Report Date
-                temp_df['report_date'] = pd.to_datetime(r_date)
+            # 1. Serve unchanged files from cache
+            frames = {}
+            profiles = {}
+            misses = []
+            for file_info in to_parse:
+                cached = cache.get(file_info['path'], file_info['date']) if cache else None
+                if cached is None or cached[1] is None:
+                    misses.append(file_info)
+                else:
+                    frames[file_info['path']], profiles[file_info['path']] = cached
+            
+            # 2. Parse the rest (serially or in a process pool) and profile them once
+            parsed, errors = parse_files(misses, workers=self.workers, columns=self.load_columns)
+            frames.update(parsed)
+            for f_path, temp_df in parsed.items():
+                profiles[f_path] = profile_frame(temp_df)
+            for f_path, err in errors.items():
+                print(f"Failed to load {f_path}: {err}")
+            
+            if cache:
+                for f_path, temp_df in parsed.items():
+                    cache.put(f_path, temp_df, profiles[f_path])
+                # Drop cache entries for files that left the directory
+                if live_paths is not None:
+                    cache.prune(live_paths)
+                cache.save()
+            
+            # 3. Apply the diff to copies. Unchanged files stay in df, addressed by row range.
+            files = {key: dict(info) for key, info in base.files.items()}
+            load_errors = dict(base.load_errors)
+            # Alias group columns are derived per version (see Dataset)
+            df = base.df.drop(columns=list(GROUP_COLUMNS), errors='ignore') if base.store is None and base.loaded else None
+            store = base.store
+            memory_report = base.memory_report
+            dropped = set(removed) | {
+                os.path.abspath(f['path']) for f in to_parse if os.path.abspath(f['path']) in files
+            }
+            for key in removed:
+                files.pop(key, None)
+                load_errors.pop(key, None)
+            
+            kept_dates = [f['date'] for k, f in files.items() if k not in dropped]
+            new_frames = {}
+            for file_info in to_parse:
+                key = os.path.abspath(file_info['path'])
+                files.pop(key, None)
+                if file_info['path'] not in frames:
+                    load_errors[key] = errors[file_info['path']]
+                    continue
+                load_errors.pop(key, None)
+                files[key] = dict(
+                    file_info, signature=file_signature(file_info['path']), profile=profiles[file_info['path']]
+                )
+                new_frames[key] = frames[file_info['path']]
+            
+            if not files:
+                self.registry.publish(load_errors=load_errors)
+                return f"Error loading data: all {len(load_errors)} files failed to load."
+            
+            # 4a. History store: re-encode from one frame per report date (untouched
+            # dates are read back from the current store)
+            if storage == "history" and (not base.loaded or dropped or new_frames):
+                by_date = {}
+                from_store = set()
+                for key in sorted(files, key=lambda k: (files[k]['date'], k)):
+                    date = pd.Timestamp(files[key]['date'])
+                    parts = by_date.setdefault(date, [])
+                    if key in new_frames:
+                        parts.append(new_frames[key])
+                    elif date not in from_store:
+                        from_store.add(date)
+                        parts.append(store.snapshot(date))
+                store = HistoryStore.from_snapshots([
+                    (date, parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True))
+                    for date, parts in by_date.items()
+                ])
+                rows = sum(store.row_count(d) for d in store.dates)
+                memory_report = {"rows": rows, "intervals": len(store.intervals), "after_mb": round(store.memory_mb(), 2)}
+                print(f"History store: {rows} rows as {len(store.intervals)} intervals ({store.memory_mb():.1f} MB)")
+            
+            # 4b. Parquet store: rewrite only the touched report dates (all of their
+            # files are in new_frames); other partitions are kept as they are
+            elif storage == "parquet" and (not base.loaded or dropped or new_frames):
+                by_date = {}
+                for key in sorted(new_frames, key=lambda k: (files[k]['date'], k)):
+                    by_date.setdefault(pd.Timestamp(files[key]['date']), []).append(new_frames[key])
+                if store is None:
+                    store = ParquetStore(os.path.join(self.data_dir, ".cache", "parquet"))
+                store = store.updated(
+                    {date: parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True) for date, parts in by_date.items()},
+                    {f['date'] for f in files.values()},
+                )
+                rows = sum(store.row_count(d) for d in store.dates)
+                memory_report = {"rows": rows, "partitions": len(store.dates), "disk_mb": round(store.disk_mb(), 2), "after_mb": round(store.memory_mb(), 2)}
+                print(f"Parquet store: {rows} rows in {len(store.dates)} partitions ({store.disk_mb():.1f} MB on disk)")
+            
+            # 4c. Rebuild df (oldest report first) - a pure append of newer weeks
+            # keeps the current frame as a single piece
+            elif storage == "frame" and (not base.loaded or dropped or new_frames):
+                new_keys = sorted(new_frames, key=lambda k: files[k]['date'])
+                if df is not None and not dropped and all(
+                    files[k]['date'] > max(kept_dates) for k in new_keys
+                ):
+                    pieces = [(None, df)] + [(k, new_frames[k]) for k in new_keys]
+                else:
+                    pieces = []
+                    for key in sorted(files, key=lambda k: (files[k]['date'], k)):
+                        if key in new_frames:
+                            pieces.append((key, new_frames[key]))
+                        else:
+                            start, stop = files[key]['rows']
+                            pieces.append((key, df.iloc[start:stop]))
                 
-                # Parse internal dates
-                if 'date_of_joining' in temp_df.columns:
-                    temp_df['date_of_joining'] = pd.to_datetime(temp_df['date_of_joining'], errors='coerce')
+                df, before_mb, after_mb = compact_concat([piece for _, piece in pieces])
+                memory_report = {"before_mb": round(before_mb, 2), "after_mb": round(after_mb, 2)}
+                print(f"Compacted data: {before_mb:.1f} MB -> {after_mb:.1f} MB")
                 
-                dfs.append(temp_df)
+                offset = 0
+                for key, piece in pieces:
+                    if key is not None:
+                        files[key]['rows'] = (offset, offset + len(piece))
+                    offset += len(piece)
             
-            # Concat
-            self.df = pd.concat(dfs, ignore_index=True)
-            self.report_date = max(self.date_range) # Set to latest for default
+            # 5. Swap in the new version (partitions and prompt context are built with it)
+            dataset = self.registry.publish(
+                files=files, load_errors=load_errors, memory_report=memory_report,
+                df=df if storage == "frame" else None, store=store if storage != "frame" else None,
+            )
             
-            self._prepare_context()
-            self.chat_history = [] 
-            
-            return f"Loaded {len(all_files)} files. Date Range: {min(self.date_range)} to {max(self.date_range)}."
+            msg = f"Loaded {len(files)} files. Date Range: {min(dataset.date_range)} to {max(dataset.date_range)}."
+            if errors:
+                failed = ", ".join(os.path.basename(p) for p in errors)
+                msg += f" Skipped {len(errors)} unreadable file(s): {failed}."
+            return msg
             
         except Exception as e:
             return f"Error loading data: {str(e)}"
@@ -98,22 +353,25 @@ class ExcelAgent:
         Runs sanity checks on the loaded dataframe.
         Returns a list of warnings/issues.
         """
-        if self.df is None:
+        if not self.dataset.loaded:
             return ["Data not loaded."]
+        if self.dataset.engine is not None:
+            return self._check_data_quality_sql(self.dataset)
+        df = self.df
             
         issues = []
         
         # 1. Duplicates
-        if 'employee_id' in self.df.columns:
-            dupes = self.df[self.df.duplicated('employee_id', keep=False)]
+        if 'employee_id' in df.columns:
+            dupes = df[df.duplicated('employee_id', keep=False)]
             if not dupes.empty:
                 issues.append(f"Found {len(dupes)} duplicate entries for Employee IDs.")
                 
         # 2. Missing Key Data
         key_cols = ['employee_name', 'reporting_manager', 'office_location']
         for col in key_cols:
-            if col in self.df.columns:
-                missing = self.df[self.df[col].isna()]
+            if col in df.columns:
+                missing = df[df[col].isna()]
                 if not missing.empty:
                     issues.append(f"Column '{col}' has {len(missing)} missing values.")
                     
@@ -126,109 +384,514 @@ class ExcelAgent:
             
         return issues
 
-    def _prepare_context(self):
+    def _check_data_quality_sql(self, dataset):
         """
-        Creates schema and values strings for the prompt.
+        check_data_quality on the Parquet partitions, without materializing df.
         """
-        if self.df is None:
-            return
+        columns = set(dataset.dtypes.index)
+        query = dataset.engine.query
+        issues = []
+        
+        # 1. Duplicates
+        if 'employee_id' in columns:
+            dupes = query(
+                "SELECT count(*) AS n FROM tracker_raw WHERE employee_id IN "
+                "(SELECT employee_id FROM tracker_raw GROUP BY employee_id HAVING count(*) > 1)"
+            )['n'].iloc[0]
+            if dupes:
+                issues.append(f"Found {dupes} duplicate entries for Employee IDs.")
+        
+        # 2. Missing Key Data
+        key_cols = [c for c in ['employee_name', 'reporting_manager', 'office_location'] if c in columns]
+        if key_cols:
+            counts = query("SELECT " + ", ".join(f'count(*) - count("{c}") AS "{c}"' for c in key_cols) + " FROM tracker_raw")
+            for col in key_cols:
+                missing = counts[col].iloc[0]
+                if missing:
+                    issues.append(f"Column '{col}' has {missing} missing values.")
+        
+        # 3. Date Range Check
+        if dataset.date_range:
+            issues.append(f"Date Range Covered: {min(dataset.date_range)} to {max(dataset.date_range)}")
+        
+        if not issues:
+            return ["âœ… Data looks clean! No obvious issues found."]
+        
+        return issues
 
-        # Schema
-        self.schema_str = "\n".join([f"- {col}: {dtype}" for col, dtype in self.df.dtypes.items()])
+    def __getattr__(self, name):
+        # Only reached for attributes not set on the agent itself
+        if name in DATASET_ATTRS:
+            return getattr(self.registry.current, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
 
-        # Unique values for important categorical columns
-        key_cols = ['office_location', 'category', 'deployment_status', 'status', 'spine_current_status', 'designation']
-        values_list = []
-        
-        # Add available dates
-        if self.date_range:
-            dates = sorted([d.strftime('%Y-%m-%d') for d in self.date_range], reverse=True)
-            values_list.append(f"AVAILABLE REPORT DATES (YYYY-MM-DD): {dates}")
-            values_list.append(f"LATEST REPORT DATE: {max(dates)}")
+    @property
+    def dataset(self):
+        """
+        The current shared dataset version (read-only).
+        """
+        return self.registry.current
 
-        for col in key_cols:
-            if col in self.df.columns:
-                uniques = self.df[col].dropna().unique().tolist()
-                # Limit to top 20 to avoid token overflow
-                if len(uniques) > 20: 
-                    uniques = uniques[:20] + ["..."]
-                values_list.append(f"{col}: {uniques}")
-        self.values_str = "\n".join(values_list)
+    @property
+    def storage(self):
+        """
+        Where loaded rows are kept: "parquet" (duckdb backend), "history"
+        (interval store) or "frame" (one in-memory df).
+        """
+        if self.backend == "duckdb":
+            return "parquet"
+        return "history" if self.history_store else "frame"
+
+    def snapshot(self, date=None):
+        """
+        Returns the rows of one report date (latest by default) as a slice of df.
+        """
+        return self.dataset.snapshot(date)
 
     def _format_chat_history(self):
-        """Format chat history for the prompt."""
-        history_str = ""
-        # Keep last 10 messages to avoid overflow
-        for msg in self.chat_history[-10:]:
-            history_str += f"{msg['role'].title()}: {msg['content']}\n"
-        return history_str if history_str else "No previous chat history."
+        """
+        Format chat history for the prompt: the most recent turns that fit in
+        the history token budget (entries are already compact summaries).
+        """
+        history_str = format_history(self.chat_history, self.prompt_builder.section_budgets["history"])
+        return history_str if history_str else NO_HISTORY
+
+    def _build_prompt(self, question, history_str=None, error=None):
+        """
+        Assembles the prompt for a question (or, with `error`, the
+        self-correction prompt) under the token budget and logs its size.
+        """
+        few_shot = ""
+        if not error:
+            with self.tracer.span("few_shot") as span:
+                few_shot = get_few_shot_examples(question, index=self.few_shot_index)
+                span["examples"] = few_shot.count("\nA:\n")
+        if history_str is None:
+            history_str = self._format_chat_history()
+        
+        with self.tracer.span("prompt_build", retry=error is not None) as span:
+            prefix_hits = self.prompt_builder.prefix_hits
+            prompt = self.prompt_builder.build(
+                self.data_version, self.schema_str, self.values_str,
+                history_str, few_shot, question, error=error,
+            )
+            span["prefix_cached"] = self.prompt_builder.prefix_hits > prefix_hits
+            span["tokens"] = prompt.sizes
+        self.last_prompt_sizes = prompt.sizes
+        print(f"Prompt tokens (est.): {prompt.sizes}")
+        return prompt
+
+    def _code_frames(self):
+        """
+        Columns of the frames generated code can use, for the validator.
+        """
+        columns = list(self.dataset.dtypes.index)
+        frames = {name: columns for name in ("df", "df_latest", "df_previous", "partitions")}
+        frames.update({name: list(table.columns) for name, table in self.dataset.changes.items()})
+        return frames
+
+    def _check_code(self, code):
+        """
+        Static validation of generated code (see validate_code). Trivial
+        issues come back fixed in check.code.
+        """
+        with self.tracer.span("validate", code_chars=len(code)) as span:
+            check = validate_code(code, self._code_frames(), self.key_values)
+            span["fixes"] = len(check.fixes)
+            span["problems"] = len(check.problems)
+        if check.fixes:
+            print(f"Auto-fixed generated code: {'; '.join(check.fixes)}")
+        if check.problems:
+            print(f"Generated code failed validation: {'; '.join(check.problems)}")
+        elif check.warnings:
+            print(f"Validation warnings (code runs as is): {'; '.join(check.warnings)}")
+        return check
+
+    def _build_repair_prompt(self, check):
+        """
+        Minimal prompt for fixing validation problems: the code, the problems,
+        the column names and the valid values of the columns involved.
+        """
+        values = []
+        for col in sorted(check.value_columns):
+            uniques = self.key_values.get(col, [])
+            if len(uniques) > 30:
+                uniques = uniques[:30] + ["..."]
+            values.append(f"Valid values of `{col}`: {uniques}")
+        return REPAIR_PROMPT.format(
+            problems="\n".join(f"- {p}" for p in check.problems),
+            code=check.code,
+            columns=", ".join(str(c) for c in self.dataset.dtypes.index),
+            values="\n".join(values),
+        )
+
+    def _validated(self, code):
+        """
+        Validates generated code before it runs. Trivial issues are fixed
+        locally; anything else gets one targeted repair call, which is much
+        smaller than regenerating with the full prompt (and cheaper than
+        executing code that is bound to fail).
+        """
+        check = self._check_code(code)
+        if check.ok:
+            return check.code
+        with self.tracer.span("repair", retries=0, problems=len(check.problems)):
+            response = self._generate(self._build_repair_prompt(check))
+        return self._check_code(self._clean_code(response.text)).code
+
+    async def _avalidated(self, code):
+        """
+        Async version of _validated.
+        """
+        check = self._check_code(code)
+        if check.ok:
+            return check.code
+        with self.tracer.span("repair", retries=0, problems=len(check.problems)):
+            response = await self._agenerate(self._build_repair_prompt(check))
+        return self._check_code(self._clean_code(response.text)).code
+
+    def _build_retry_prompt(self, question, history_str, error):
+        """
+        Prompt for regenerating code after it failed with `error`.
+        """
+        return self._build_prompt(question, history_str, error=error)
+
+    def _acquire(self, prompt):
+        """
+        Waits for the shared rate limiter: one request for the call, plus one
+        for creating the context cache when this call will create it.
+        Returns the total wait in seconds.
+        """
+        waited = 0.0
+        if self._creates_context_cache(prompt):
+            waited += self.rate_limiter.acquire(estimate_tokens(prompt.prefix, expected_output=0))
+        return waited + self.rate_limiter.acquire(estimate_tokens(str(prompt)))
+
+    async def _aacquire(self, prompt):
+        """
+        Async version of _acquire.
+        """
+        waited = 0.0
+        if self._creates_context_cache(prompt):
+            waited += await self.rate_limiter.acquire_async(estimate_tokens(prompt.prefix, expected_output=0))
+        return waited + await self.rate_limiter.acquire_async(estimate_tokens(str(prompt)))
+
+    def _creates_context_cache(self, prompt):
+        return (self.use_context_cache and isinstance(prompt, BuiltPrompt)
+                and self._context_cache_version != prompt.version)
+
+    def _target(self, prompt):
+        """
+        Picks the model and contents for a call. With a provider-side context
+        cache holding the prompt's prefix, only the suffix is sent.
+        """
+        if self.use_context_cache and isinstance(prompt, BuiltPrompt):
+            model = self._context_cached_model(prompt)
+            if model is not None:
+                return model, prompt.suffix
+        return self.model, str(prompt)
+
+    def _context_cached_model(self, prompt):
+        """
+        Returns a model bound to a Gemini context cache of the prompt prefix,
+        creating it once per data version. None if caching isn't available.
+        """
+        with self._context_cache_lock:
+            if self._context_cache_version != prompt.version:
+                if self._context_cache is not None:
+                    try:
+                        self._context_cache.delete()
+                    except Exception:
+                        pass
+                self._context_cache = None
+                self._context_cache_model = None
+                try:
+                    self._context_cache = genai.caching.CachedContent.create(
+                        model=self.model.model_name,
+                        system_instruction=prompt.prefix,
+                        ttl=datetime.timedelta(hours=1),
+                    )
+                    self._context_cache_model = genai.GenerativeModel.from_cached_content(self._context_cache)
+                except Exception as e:
+                    print(f"Context cache unavailable, sending full prompts: {e}")
+                self._context_cache_version = prompt.version
+            return self._context_cache_model
+
+    @staticmethod
+    def _clean_code(text):
+        """
+        Strips markdown fences from a model response.
+        """
+        code = text.strip()
+        if "```" in code:
+            code = code.replace("```python", "").replace("```", "")
+        return code.strip()
+
+    @retry(
+        retry=retry_if_exception_type(google.api_core.exceptions.ResourceExhausted),
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=2, min=4, max=30),
+        before_sleep=trace_backoff,
+    )
+    def _generate(self, prompt):
+        """
+        Every model call goes through here: shared rate limiter, then Gemini.
+        """
+        with self.tracer.span("gemini_call", streamed=False) as span:
+            span["queue_wait_s"] = round(self._acquire(prompt), 3)
+            model, contents = self._target(prompt)
+            span["prompt_chars"] = len(contents)
+            response = model.generate_content(contents)
+            span["response_chars"] = len(response.text)
+        return response
+
+    @retry(
+        retry=retry_if_exception_type(google.api_core.exceptions.ResourceExhausted),
+        stop=stop_after_attempt(5),
+        wait=wait_exponential(multiplier=2, min=4, max=30),
+        before_sleep=trace_backoff,
+    )
+    async def _agenerate(self, prompt):
+        """
+        Async version of _generate.
+        """
+        with self.tracer.span("gemini_call", streamed=False) as span:
+            span["queue_wait_s"] = round(await self._aacquire(prompt), 3)
+            model, contents = self._target(prompt)
+            span["prompt_chars"] = len(contents)
+            response = await model.generate_content_async(contents)
+            span["response_chars"] = len(response.text)
+        return response
 
     @retry(
         retry=retry_if_exception_type(google.api_core.exceptions.ResourceExhausted),
         stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=2, min=4, max=30)
+        wait=wait_exponential(multiplier=2, min=4, max=30),
+        before_sleep=trace_backoff,
     )
-    def generate_code(self, question):
+    def _generate_streamed(self, prompt, on_chunk=None):
+        """
+        Streams a model response, reporting the partial code to on_chunk(code)
+        and stopping as soon as the fenced code block is closed.
+        """
+        with self.tracer.span("gemini_call", streamed=True, early_stop=False) as span:
+            span["queue_wait_s"] = round(self._acquire(prompt), 3)
+            model, contents = self._target(prompt)
+            span["prompt_chars"] = len(contents)
+            response = model.generate_content(contents, stream=True)
+            
+            text = ""
+            code = ""
+            for chunk in response:
+                text += chunk.text
+                span["response_chars"] = len(text)
+                code, complete = extract_code(text)
+                if on_chunk is not None:
+                    on_chunk(code)
+                if complete:
+                    # Don't wait for whatever the model adds after the code
+                    span["early_stop"] = True
+                    return code
+            return self._clean_code(text)
+
+    def generate_code(self, question, history_str=None, on_chunk=None):
         """
         Generates pandas code using LLM.
+        If on_chunk is given, the response is streamed and on_chunk(partial_code)
+        is called as code arrives.
         """
-        few_shot = get_few_shot_examples(question)
-        history_str = self._format_chat_history()
-        
-        prompt = SYSTEM_PROMPT.format(
-            schema_context=self.schema_str,
-            values_context=self.values_str,
-            chat_history=history_str,
-            few_shot_examples=few_shot,
-            user_question=question
+        with self.tracer.span("generate", retries=0):
+            prompt = self._build_prompt(question, history_str)
+            if on_chunk is not None:
+                return self._generate_streamed(prompt, on_chunk)
+            response = self._generate(prompt)
+            return self._clean_code(response.text)
+
+    async def agenerate_code(self, question, history_str=None):
+        """
+        Async version of generate_code (uses the async Gemini client).
+        """
+        with self.tracer.span("generate", retries=0):
+            prompt = self._build_prompt(question, history_str)
+            response = await self._agenerate(prompt)
+            return self._clean_code(response.text)
+
+    def _sandbox_vars(self, dataset=None):
+        """
+        Data variables exposed to generated code. The frames are shared by
+        every session, so code gets shallow (copy-on-write) views it can
+        modify without touching the registry's copy. Frames are built when
+        the code first uses them (df is materialized on demand with a
+        store). With the duckdb backend `sql(query)` runs against the
+        Parquet partitions.
+        """
+        dataset = dataset or self.dataset
+        dates = list(dataset.partitions)
+        values = {name: table.copy(deep=False) for name, table in dataset.changes.items()}  # joiners / leavers / transitions
+        values["pd"] = pd
+        if dataset.engine is not None:
+            values["sql"] = dataset.engine.query
+        return LazyVars(values, loaders={
+            "df": lambda: dataset.df.copy(deep=False) if dataset.loaded else None,
+            "df_latest": lambda: dataset.snapshot(),
+            "df_previous": lambda: dataset.snapshot(dates[-2]) if len(dates) > 1 else None,
+            "partitions": lambda: LazyFrames(dates, dataset.snapshot),
+        })
+
+    def _get_exec_pool(self):
+        """
+        Returns the worker pool for the current data. Pools are shared by every
+        session with the same settings and re-forked after a reload (the
+        registry closes the old one on publish).
+        """
+        dataset = self.dataset
+        if self.exec_workers <= 0 or not dataset.loaded:
+            return None
+        return self.registry.versioned_resource(
+            ("exec_pool", self.exec_workers, self.exec_timeout, self.exec_memory_mb),
+            dataset,
+            lambda ds: ExecutionPool(
+                self._sandbox_vars(ds),
+                workers=self.exec_workers,
+                timeout=self.exec_timeout,
+                memory_mb=self.exec_memory_mb,
+                version=ds.version,
+            ),
         )
-        
-        response = self.model.generate_content(prompt)
-        code = response.text.strip()
-        
-        # Clean markdown
-        if code.startswith("```python"):
-            code = code.replace("```python", "").replace("```", "")
-        elif code.startswith("```"):
-            code = code.replace("```", "")
-            
-        return code.strip()
 
     def execute_code(self, code):
         """
         Executes the generated code in a safe local environment.
+        With exec_workers > 0 it runs in an isolated worker process with a
+        timeout and memory cap; otherwise in-process, serialized by a lock
+        (pandas/matplotlib state is not thread-safe).
+        With profile_exec on, the cProfile summary is attached to the trace.
         """
+        with self.tracer.span("exec", code_chars=len(code)) as span:
+            result, explanation, profile = self._execute(code)
+            span.update(describe_result(result))
+            span["failed"] = str(result).startswith("Error:")
+            if profile:
+                span["profile"] = profile
+                print(f"Execution profile:\n{profile}")
+        return result, explanation
+
+    def _execute(self, code):
+        """
+        Returns (result, explanation, profile text or None).
+        """
+        pool = self._get_exec_pool()
+        while pool is not None:
+            span = self.tracer.current()
+            if span is not None:
+                span["mode"] = "pool"
+            reply = pool.execute(code, profile=self.profile_exec)
+            if reply is not None:
+                return reply
+            # The data was reloaded while waiting for a worker
+            pool = self._get_exec_pool()
+        
         # Sandbox variables
         import matplotlib.pyplot as plt
         import plotly.express as px
         
-        local_vars = {
-            "df": self.df, 
-            "pd": pd,
+        local_vars = self._sandbox_vars()
+        local_vars.update({
             "plt": plt,
             "px": px,
             "result": None,
             "explanation": None
-        }
+        })
         
-        try:
-            exec(code, {}, local_vars)
-            return local_vars.get("result", "No result found"), local_vars.get("explanation", "No explanation provided.")
-        except Exception as e:
-            return f"Error: {str(e)}", None
+        with self._exec_lock:
+            try:
+                profile = None
+                if self.profile_exec:
+                    profile = profile_exec(code, local_vars)
+                else:
+                    exec(code, {}, local_vars)
+                return local_vars.get("result", "No result found"), local_vars.get("explanation", "No explanation provided."), profile
+            except Exception as e:
+                return f"Error: {str(e)}", None, None
 
-    def run(self, question):
+    def _answer_locally(self, question, history_str):
+        """
+        Tries the fast path, then the code cache.
+        Returns (response or None, code cache key).
+        """
+        with self.tracer.span("local_answer", hit=None) as span:
+            # Template questions (counts, breakdowns, week-over-week) skip the LLM
+            if self.fast_path_confidence is not None:
+                match = match_question(question, self.key_values, dates=self.partitions, aliases=self.dataset.aliases)
+                if match and match["confidence"] >= self.fast_path_confidence:
+                    print(f"Fast path ({match['intent']}, confidence {match['confidence']:.2f}) for: {question}")
+                    dates = list(self.partitions)
+                    response = answer_match(
+                        match, self.snapshot(),
+                        df_previous=self.snapshot(dates[-2]) if len(dates) > 1 else None,
+                        snapshot=self.snapshot,
+                    )
+                    span["hit"] = "fast_path"
+                    return response, None
+        
+            if self.code_cache is None:
+                return None, None
+        
+            cache_key = CodeCache.make_key(question, self.data_version, history_str)
+            code = self.code_cache.get(cache_key)
+            if code is not None:
+                print(f"Code cache hit for: {question}")
+                result, explanation = self.execute_code(code)
+                if not str(result).startswith("Error:"):
+                    span["hit"] = "code_cache"
+                    return {"result": result, "explanation": explanation, "code": code}, cache_key
+                # Stale entry - drop it and go through the model
+                self.code_cache.invalidate(cache_key)
+            return None, cache_key
+
+    def _finish(self, question, result, explanation, code=None, cache_key=None, record_history=True,
+                standalone=False):
+        # Only cache code that actually ran
+        if code is not None and not str(result).startswith("Error:"):
+            if cache_key is not None:
+                self.code_cache.put(cache_key, code)
+            # Questions that didn't lean on chat history make reusable examples
+            if standalone:
+                self.few_shot_index.add(question, code)
+        
+        # Update History
+        if record_history:
+            self.chat_history.extend(history_entry(question, result, code))
+        
+        return {"result": result, "explanation": explanation}
+
+    def run(self, question, on_chunk=None):
         """
         Full pipeline: Generate -> Execute -> Retry.
         Returns a dictionary with 'result' and 'explanation'.
+        Pass on_chunk(partial_code) to stream generation progress.
         """
-        if self.df is None:
+        with self.tracer.span("run", streamed=on_chunk is not None, question_chars=len(question)) as span:
+            response = self._run(question, on_chunk, span)
+            span.update(describe_result(response["result"]))
+        return response
+
+    def _run(self, question, on_chunk, span):
+        if not self.dataset.loaded:
             return {"result": "Data not loaded.", "explanation": ""}
-            
+        
+        history_str = self._format_chat_history()
+        response, cache_key = self._answer_locally(question, history_str)
+        if response is not None:
+            span["path"] = "local"
+            return self._finish(question, response["result"], response["explanation"], response.get("code"))
+        span["path"] = "model"
+        
         print(f"Generating code for: {question}")
         
         try:
-            code = self.generate_code(question)
+            code = self.generate_code(question, history_str, on_chunk=on_chunk)
+            code = self._validated(code)
         except Exception as e:
             print(f"Generation failed: {e}")
             return {"result": "âš ï¸  **Server Busy / Rate Limit Hit**.\nPlease wait 30 seconds and try again.", "explanation": f"API Error: {str(e)}"}
@@ -240,17 +903,82 @@ class ExcelAgent:
         # Simple Retry Logic
         if str(result).startswith("Error:"):
             print("Code failed. Retrying...")
-            # Re-generate with error context
-            history_str = self._format_chat_history()
-            full_prompt = f"{SYSTEM_PROMPT.format(schema_context=self.schema_str, values_context=self.values_str, chat_history=history_str, few_shot_examples='', user_question=question)}\n\nUser: The previous code failed: {result}. Fix it."
+            span["retried"] = True
+            with self.tracer.span("retry", retries=0, exec_error=str(result)[:200]):
+                # Re-generate with error context
+                retry_prompt = self._build_retry_prompt(question, history_str, result)
+                if on_chunk is not None:
+                    code = self._generate_streamed(retry_prompt, on_chunk)
+                else:
+                    code = self._clean_code(self._generate(retry_prompt).text)
+                code = self._check_code(code).code
+                print(f"Retried Code:\n{code}")
+                result, explanation = self.execute_code(code)
+        
+        return self._finish(question, result, explanation, code, cache_key, standalone=history_str == NO_HISTORY)
+
+    async def arun(self, question, use_history=True):
+        """
+        Async version of run. Generation awaits the Gemini client; the pandas
+        exec step runs in a worker thread under the same lock as execute_code.
+        With use_history=False the question is answered standalone and not
+        added to chat_history.
+        """
+        with self.tracer.span("run", streamed=False, question_chars=len(question)) as span:
+            response = await self._arun(question, use_history, span)
+            span.update(describe_result(response["result"]))
+        return response
+
+    async def _arun(self, question, use_history, span):
+        if not self.dataset.loaded:
+            return {"result": "Data not loaded.", "explanation": ""}
+        
+        history_str = self._format_chat_history() if use_history else NO_HISTORY
+        response, cache_key = await asyncio.to_thread(self._answer_locally, question, history_str)
+        if response is not None:
+            span["path"] = "local"
+            return self._finish(question, response["result"], response["explanation"], response.get("code"),
+                                record_history=use_history)
+        span["path"] = "model"
+        
+        try:
+            code = await self.agenerate_code(question, history_str)
+            code = await self._avalidated(code)
+        except Exception as e:
+            print(f"Generation failed: {e}")
+            return {"result": "âš ï¸  **Server Busy / Rate Limit Hit**.\nPlease wait 30 seconds and try again.", "explanation": f"API Error: {str(e)}"}
+        
+        result, explanation = await asyncio.to_thread(self.execute_code, code)
+        
+        # Simple Retry Logic
+        if str(result).startswith("Error:"):
+            span["retried"] = True
+            with self.tracer.span("retry", retries=0, exec_error=str(result)[:200]):
+                response = await self._agenerate(self._build_retry_prompt(question, history_str, result))
+                code = self._check_code(self._clean_code(response.text)).code
+                result, explanation = await asyncio.to_thread(self.execute_code, code)
+        
+        return self._finish(
+            question, result, explanation, code, cache_key,
+            record_history=use_history, standalone=history_str == NO_HISTORY,
+        )
+
+    def run_batch(self, questions, concurrency=4):
+        """
+        Answers independent questions with up to `concurrency` model calls in
+        flight. Questions don't see or extend chat_history.
+        Returns the responses in input order.
+        """
+        async def answer_all():
+            semaphore = asyncio.Semaphore(max(1, concurrency))
             
-            response = self.model.generate_content(full_prompt)
-            code = response.text.replace("```python", "").replace("```", "").strip()
-            print(f"Retried Code:\n{code}")
-            result, explanation = self.execute_code(code)
+            async def answer(question):
+                async with semaphore:
+                    try:
+                        return await self.arun(question, use_history=False)
+                    except Exception as e:
+                        return {"result": f"Error: {str(e)}", "explanation": None}
             
-        # Update History
-        self.chat_history.append({"role": "user", "content": question})
-        self.chat_history.append({"role": "assistant", "content": str(result)})
+            return await asyncio.gather(*(answer(q) for q in questions))
         
-        return {"result": result, "explanation": explanation}
+        return asyncio.run(answer_all())
@@ -0,0 +1,175 @@
+import re
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz, process
+
+# Canonical columns added to the data: group column -> raw column
+GROUP_COLUMNS = {'location_group': 'office_location', 'designation_group': 'designation'}
+
+# City names and spellings, matched against each word of a location value
+LOCATION_NAMES = {
+    "bengaluru": "Bengaluru", "bangalore": "Bengaluru",
+    "delhi": "Delhi",
+    "gurgaon": "Gurgaon", "gurugram": "Gurgaon",
+    "noida": "Noida",
+    "mumbai": "Mumbai", "bombay": "Mumbai",
+    "hyderabad": "Hyderabad",
+    "chennai": "Chennai", "madras": "Chennai",
+    "pune": "Pune",
+    "kolkata": "Kolkata", "calcutta": "Kolkata",
+}
+
+# Abbreviations users type -> location groups. Also matched against whole
+# location values that are just an abbreviation (e.g. 'BLR').
+LOCATION_ALIASES = {
+    "BLR": ["Bengaluru"], "DEL": ["Delhi"], "NCR": ["Delhi", "Gurgaon", "Noida"],
+    "MUM": ["Mumbai"], "HYD": ["Hyderabad"], "CHE": ["Chennai"], "PUN": ["Pune"],
+    "KOL": ["Kolkata"], "CAL": ["Kolkata"], "GGN": ["Gurgaon"],
+}
+
+# Abbreviated words in designations
+DESIGNATION_WORDS = {
+    "sr": "senior", "snr": "senior", "jr": "junior", "mgr": "manager", "asst": "assistant",
+    "assoc": "associate", "dir": "director", "exec": "executive", "cons": "consultant",
+}
+
+# fuzz.ratio (0-100) needed to treat two spellings as the same value
+FUZZY_THRESHOLD = 88
+
+def _words(value, expand=None):
+    words = re.findall(r"[a-z0-9]+", str(value).lower())
+    return [expand.get(w, w) for w in words] if expand else words
+
+def _close(a, b):
+    """
+    Same number of words and every differing word is a long-enough near
+    match - 'Consultnat' joins 'Consultant', 'Consultant II' stays apart
+    from 'Consultant I'.
+    """
+    wa, wb = a.split(), b.split()
+    if len(wa) != len(wb) or fuzz.ratio(a, b) < FUZZY_THRESHOLD:
+        return False
+    return all(x == y or (min(len(x), len(y)) >= 4 and fuzz.ratio(x, y) >= 80) for x, y in zip(wa, wb))
+
+def _cluster(values, key, groups):
+    """
+    Assigns each raw value (most frequent first) to the group of an equal or
+    close key, or starts a new group named after it. `groups` maps the keys
+    seen so far to their group and is extended in place.
+    """
+    mapping = {}
+    for value in values:
+        k = key(value)
+        if not k:
+            continue
+        if k not in groups:
+            for candidate, _ in process.extractBests(k, list(groups), scorer=fuzz.ratio, limit=3) if groups else []:
+                if _close(k, candidate):
+                    groups[k] = groups[candidate]
+                    break
+            else:
+                groups[k] = " ".join(str(value).split())
+        mapping[value] = groups[k]
+    return mapping
+
+def _location_group(value):
+    """
+    Known city for a raw location, or None.
+    """
+    words = _words(value)
+    whole = " ".join(words).upper()
+    if whole in LOCATION_ALIASES and len(LOCATION_ALIASES[whole]) == 1:
+        return LOCATION_ALIASES[whole][0]
+    for word in words:
+        if word in LOCATION_NAMES:
+            return LOCATION_NAMES[word]
+    # Misspelled city names ('Banglore', 'Hyderbad')
+    for word in words:
+        if len(word) >= 5:
+            match = process.extractOne(word, list(LOCATION_NAMES), scorer=fuzz.ratio, score_cutoff=FUZZY_THRESHOLD)
+            if match:
+                return LOCATION_NAMES[match[0]]
+    return None
+
+def build_alias_index(key_values):
+    """
+    Maps raw office_location / designation values (ranked by frequency, as in
+    the merged profiles) to canonical groups:
+    {group column: {raw value: group}}.
+
+    Locations go to a known city (by name, alternate spelling, abbreviation or
+    a fuzzy match of either); other locations and all designations are
+    grouped with spellings that differ only by case, punctuation,
+    abbreviated words (Sr., Mgr) or a typo. A group is named after its most
+    frequent (unabbreviated) spelling.
+    """
+    index = {}
+
+    locations = [v for v in key_values.get(GROUP_COLUMNS['location_group'], []) if isinstance(v, str)]
+    mapping = {}
+    for value in locations:
+        group = _location_group(value)
+        if group is not None:
+            mapping[value] = group
+    known = {" ".join(_words(g)): g for g in set(mapping.values())}
+    mapping.update(_cluster([v for v in locations if v not in mapping], lambda v: " ".join(_words(v)), known))
+    index['location_group'] = mapping
+
+    designations = [v for v in key_values.get(GROUP_COLUMNS['designation_group'], []) if isinstance(v, str)]
+    mapping = _cluster(designations, lambda v: " ".join(_words(v, DESIGNATION_WORDS)), {})
+    # Name a group after its most frequent unabbreviated spelling ('Senior Manager', not 'Sr Manager')
+    names = {}
+    for value in designations:
+        if value in mapping and _words(value) == _words(value, DESIGNATION_WORDS):
+            names.setdefault(mapping[value], " ".join(value.split()))
+    index['designation_group'] = {value: names.get(group, group) for value, group in mapping.items()}
+    return index
+
+def group_dtype(mapping):
+    return pd.CategoricalDtype(sorted(set(mapping.values())))
+
+def add_group_columns(df, index):
+    """
+    Returns df (shallow copy) with a categorical group column after each
+    source column in GROUP_COLUMNS. Categorical sources are mapped through
+    their categories, so the cost doesn't depend on the string lengths.
+    """
+    out = df.drop(columns=[c for c in GROUP_COLUMNS if c in df.columns])
+    for group_col, source in GROUP_COLUMNS.items():
+        mapping = index.get(group_col)
+        if mapping is None or source not in out.columns:
+            continue
+        dtype = group_dtype(mapping)
+        col = out[source]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            # Category code -> group code (-1 = no group; also used for NaN codes)
+            lookup = np.array(
+                [dtype.categories.get_loc(mapping[c]) if c in mapping else -1 for c in col.cat.categories] + [-1],
+                dtype=np.int32,
+            )
+            values = pd.Categorical.from_codes(lookup[col.cat.codes.to_numpy()], dtype=dtype)
+        else:
+            values = pd.Categorical(col.map(mapping), dtype=dtype)
+        out.insert(out.columns.get_loc(source) + 1, group_col, values)
+    return out
+
+def describe_alias_index(index):
+    """
+    Prompt lines: each group with the raw values it covers (single-value
+    groups just by name) and the abbreviations of the groups present.
+    """
+    lines = []
+    for group_col, mapping in index.items():
+        members = {}
+        for value, group in mapping.items():
+            members.setdefault(group, []).append(value)
+        parts = [f"{g} = {sorted(v)}" if v != [g] else g for g, v in sorted(members.items())]
+        lines.append(f"{group_col} (canonical {GROUP_COLUMNS[group_col]}): " + "; ".join(parts))
+    present = set(index.get('location_group', {}).values())
+    abbreviations = [
+        f"{alias} -> {', '.join(g for g in groups if g in present)}"
+        for alias, groups in LOCATION_ALIASES.items() if present.intersection(groups)
+    ]
+    if abbreviations:
+        lines.append("LOCATION ABBREVIATIONS (-> location_group): " + "; ".join(abbreviations))
+    return "\n".join(lines)
@@ -0,0 +1,139 @@
+import io
+import os
+import uuid
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+PAGE_ROWS = 200
+
+def _is_matplotlib(result):
+    return hasattr(result, "savefig") or hasattr(getattr(result, "figure", None), "savefig")
+
+def _is_plotly(result):
+    return hasattr(result, "to_json") and hasattr(result, "to_plotly_json")
+
+def _to_parquet(df):
+    """
+    Parquet bytes with one row group per page, so pages can be read
+    without decoding the whole table.
+    """
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    buf = io.BytesIO()
+    try:
+        df.to_parquet(buf, row_group_size=PAGE_ROWS)
+    except Exception:
+        # Mixed-type object columns can't be typed by Arrow - store them as text
+        buf = io.BytesIO()
+        mixed = {c: "str" for c in df.columns if df[c].dtype == object}
+        df.astype(mixed).to_parquet(buf, row_group_size=PAGE_ROWS)
+    return buf.getvalue()
+
+class ArtifactStore:
+    """
+    Per-session store for the charts and tables shown in the chat.
+
+    Results are serialized once when they arrive: matplotlib figures to PNG
+    (the figure is closed afterwards), Plotly figures to JSON and tables to
+    Parquet, paged by row group. Reruns render from these blobs instead of
+    re-drawing live objects. The total size is capped at `budget_bytes`;
+    the least recently viewed artifacts are dropped first.
+    """
+    def __init__(self, budget_bytes=None):
+        if budget_bytes is None:
+            budget_bytes = int(float(os.getenv("AGENT_SESSION_ARTIFACT_MB", "50")) * 1024 * 1024)
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.evicted = 0
+        self._items = OrderedDict()  # id -> {"kind", "data", "bytes", ...}
+        self._lock = threading.Lock()
+
+    def put(self, result):
+        """
+        Stores a chart or table result. Returns its artifact id, or None for
+        results that are shown as text.
+        """
+        if _is_matplotlib(result):
+            import matplotlib.pyplot as plt
+            fig = result if hasattr(result, "savefig") else result.figure
+            buf = io.BytesIO()
+            fig.savefig(buf, format="png", bbox_inches="tight")
+            plt.close(fig)
+            entry = {"kind": "png", "data": buf.getvalue()}
+        elif _is_plotly(result):
+            entry = {"kind": "plotly", "data": result.to_json().encode("utf-8")}
+        elif isinstance(result, (pd.DataFrame, pd.Series, list)):
+            if isinstance(result, list):
+                df = pd.DataFrame(result)
+            elif isinstance(result, pd.Series):
+                df = result.to_frame()
+            else:
+                df = result
+            entry = {"kind": "table", "data": _to_parquet(df), "rows": len(df), "columns": len(df.columns)}
+        else:
+            return None
+
+        entry["bytes"] = len(entry["data"])
+        artifact_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._items[artifact_id] = entry
+            self.used_bytes += entry["bytes"]
+            self._evict(keep=artifact_id)
+        return artifact_id
+
+    def _evict(self, keep=None):
+        while self.used_bytes > self.budget_bytes and len(self._items) > 1:
+            oldest = next(iter(self._items))
+            if oldest == keep:
+                break
+            self.used_bytes -= self._items.pop(oldest)["bytes"]
+            self.evicted += 1
+
+    def get(self, artifact_id):
+        """
+        Returns the stored entry (marking it recently used), or None if it was evicted.
+        """
+        with self._lock:
+            entry = self._items.get(artifact_id)
+            if entry is not None:
+                self._items.move_to_end(artifact_id)
+            return entry
+
+    def pages(self, artifact_id):
+        entry = self.get(artifact_id)
+        return max(1, -(-entry["rows"] // PAGE_ROWS)) if entry else 0
+
+    def table_page(self, artifact_id, page=0):
+        """
+        Decodes one page (row group) of a stored table.
+        """
+        import pyarrow.parquet as pq
+        entry = self.get(artifact_id)
+        if entry is None:
+            return None
+        parquet = pq.ParquetFile(io.BytesIO(entry["data"]))
+        if parquet.num_row_groups == 0:
+            return parquet.read().to_pandas()
+        page = min(max(page, 0), parquet.num_row_groups - 1)
+        return parquet.read_row_group(page).to_pandas()
+
+    def table(self, artifact_id):
+        entry = self.get(artifact_id)
+        return pd.read_parquet(io.BytesIO(entry["data"])) if entry else None
+
+    def table_csv(self, artifact_id):
+        """
+        CSV export of a stored table, built only when requested.
+        """
+        df = self.table(artifact_id)
+        return df.to_csv(index=False).encode("utf-8") if df is not None else b""
+
+    def stats(self):
+        with self._lock:
+            return {
+                "artifacts": len(self._items),
+                "used_mb": round(self.used_bytes / 1024 / 1024, 2),
+                "budget_mb": round(self.budget_bytes / 1024 / 1024, 2),
+                "evicted": self.evicted,
+            }
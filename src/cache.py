@@ -0,0 +1,249 @@
+import os
+import re
+import time
+import json
+import threading
+import hashlib
+from collections import OrderedDict
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+CACHE_VERSION = 4
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Returns the sha1 hex digest of a file's content.
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class FrameCache:
+    """
+    On-disk cache of normalized per-file DataFrames.
+
+    Entries are keyed by the workbook path and validated against its size,
+    mtime and content hash, and tagged with `reader` (the reader settings,
+    e.g. the projected columns) so frames read differently aren't reused.
+    Frames are stored without 'report_date', which is stamped on when read
+    back: for files without a date in the name it is the file's mtime, so it
+    can change while the content doesn't. Frames are stored as Parquet (pickle when pyarrow is missing or the frame
+    has mixed-type columns Arrow can't encode).
+    """
+    def __init__(self, cache_dir, reader=None):
+        self.cache_dir = cache_dir
+        self.reader = reader
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.manifest = self._load_manifest()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == CACHE_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {"version": CACHE_VERSION, "entries": {}}
+
+    def _key(self, f_path):
+        return os.path.abspath(f_path)
+
+    def _blob_path(self, key, fmt):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.{fmt}")
+
+    def get(self, f_path, report_date=None):
+        """
+        Returns (DataFrame, column profile) cached for f_path, or None if
+        missing or stale. `report_date` (the date resolved for the file now)
+        is set on the frame and in the profile.
+        """
+        key = self._key(f_path)
+        entry = self.manifest["entries"].get(key)
+        if entry is None or not os.path.exists(entry["blob"]) or entry.get("reader") != self.reader:
+            self.misses += 1
+            return None
+
+        stat = os.stat(f_path)
+        if entry["size"] != stat.st_size:
+            self.misses += 1
+            return None
+        if entry["mtime_ns"] != stat.st_mtime_ns:
+            # Touched but maybe not changed - fall back to the content hash
+            if entry["sha1"] != file_hash(f_path):
+                self.misses += 1
+                return None
+            entry["mtime_ns"] = stat.st_mtime_ns
+
+        try:
+            if entry["format"] == "parquet":
+                df = pd.read_parquet(entry["blob"])
+            else:
+                df = pd.read_pickle(entry["blob"])
+        except Exception as e:
+            print(f"Cache read failed for {f_path}: {e}")
+            self.misses += 1
+            return None
+
+        profile = entry.get("profile")
+        if report_date is not None:
+            date = pd.to_datetime(report_date)
+            df['report_date'] = date
+            if profile is not None:
+                profile = dict(profile, dates=dict(profile.get("dates", {}), report_date=[date.isoformat()] * 2))
+        self.hits += 1
+        return df, profile
+
+    def put(self, f_path, df, profile=None):
+        """
+        Stores the normalized DataFrame (and its column profile) for f_path.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        key = self._key(f_path)
+        stat = os.stat(f_path)
+
+        df = df.drop(columns=['report_date'], errors='ignore')
+        fmt = "pickle"
+        blob = self._blob_path(key, "parquet")
+        if HAS_PARQUET:
+            try:
+                df.to_parquet(blob, index=False)
+                fmt = "parquet"
+            except Exception:
+                # Mixed-type object columns (common in hand-edited sheets)
+                if os.path.exists(blob):
+                    os.remove(blob)
+        if fmt == "pickle":
+            blob = self._blob_path(key, "pkl")
+            df.to_pickle(blob)
+
+        old = self.manifest["entries"].get(key)
+        if old and old["blob"] != blob and os.path.exists(old["blob"]):
+            os.remove(old["blob"])
+
+        self.manifest["entries"][key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": file_hash(f_path),
+            "format": fmt,
+            "blob": blob,
+            "profile": profile,
+            "reader": self.reader,
+        }
+
+    def prune(self, live_paths):
+        """
+        Evicts entries for workbooks that are no longer present.
+        """
+        live = {self._key(p) for p in live_paths}
+        for key in list(self.manifest["entries"]):
+            if key not in live:
+                entry = self.manifest["entries"].pop(key)
+                if os.path.exists(entry["blob"]):
+                    os.remove(entry["blob"])
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+def normalize_question(question):
+    """
+    Lowercases, drops punctuation and collapses whitespace so trivially
+    different phrasings of the same question share a cache key.
+    """
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+class CodeCache:
+    """
+    Persistent question -> code cache with LRU and TTL eviction.
+
+    Keys combine the normalized question, a fingerprint of the data context
+    (schema + valid values) and the chat history that goes into the prompt,
+    so a new upload or a different conversation never reuses stale code.
+    One instance is shared by every session on a data directory, so all
+    access to `entries` goes through `_lock`.
+    """
+    _save_lock = threading.Lock()
+
+    def __init__(self, path, max_entries=500, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for key, entry in json.load(f).items():
+                    self.entries[key] = entry
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def make_key(question, data_fingerprint, history_str=""):
+        raw = json.dumps([normalize_question(question), data_fingerprint, history_str])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or time.time() - entry["created"] > self.ttl_seconds:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["code"]
+
+    def put(self, key, code):
+        with self._lock:
+            self.entries[key] = {"code": code, "created": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.save()
+
+    def invalidate(self, key):
+        with self._lock:
+            removed = self.entries.pop(key, None) is not None
+        if removed:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            entries, hits, misses = len(self.entries), self.hits, self.misses
+        total = hits + misses
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+        }
+
+    def save(self):
+        # Snapshot under the entry lock, so lookups aren't blocked by the file write
+        with self._lock:
+            entries = dict(self.entries)
+        # Streamlit sessions are threads of one process - serialize writers
+        with self._save_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,97 @@
+import pandas as pd
+
+# Attributes whose week-over-week changes are materialized
+TRACKED_COLUMNS = ['deployment_status', 'spine_current_status', 'designation', 'office_location']
+
+# Extra columns carried on joiner/leaver rows for context
+DETAIL_COLUMNS = ['employee_name', 'designation', 'office_location', 'deployment_status', 'spine_current_status']
+
+def _by_employee(frame, columns):
+    # One row per employee (trackers occasionally repeat an ID)
+    cols = ['employee_id'] + [c for c in dict.fromkeys(columns) if c in frame.columns and c != 'employee_id']
+    return frame[cols].drop_duplicates('employee_id')
+
+def _as_text(series):
+    # Compare categoricals from different weeks by value, not by code
+    return series.astype(object).where(series.notna(), None)
+
+def build_change_tables(snapshots):
+    """
+    Week-over-week changes between consecutive report dates, keyed by employee_id.
+
+    `snapshots` is an iterable of (report_date, frame) pairs, oldest first
+    (only two consecutive frames are held at a time).
+    Returns a dict of DataFrames:
+      - joiners: employees present on report_date but not on previous_date
+      - leavers: employees present on previous_date but gone on report_date
+        (attributes as last seen)
+      - transitions: one row per employee and changed column, with
+        from_value / to_value
+    """
+    empty_detail = ['report_date', 'previous_date', 'employee_id'] + DETAIL_COLUMNS
+    tables = {"joiners": [], "leavers": [], "transitions": []}
+
+    previous = None
+    for date, cur in snapshots:
+        if previous is None:
+            previous = (date, cur)
+            continue
+        (prev_date, prev), previous = previous, (date, cur)
+        if 'employee_id' not in cur.columns or 'employee_id' not in prev.columns:
+            continue
+        prev = _by_employee(prev, DETAIL_COLUMNS + TRACKED_COLUMNS)
+        cur = _by_employee(cur, DETAIL_COLUMNS + TRACKED_COLUMNS)
+        merged = prev.merge(cur, on='employee_id', how='outer', suffixes=('_prev', ''), indicator=True)
+
+        # 1. Joiners / leavers
+        for name, side, suffix in (("joiners", "right_only", ""), ("leavers", "left_only", "_prev")):
+            rows = merged[merged['_merge'] == side]
+            if rows.empty:
+                continue
+            out = pd.DataFrame({'report_date': date, 'previous_date': prev_date, 'employee_id': rows['employee_id']})
+            for col in DETAIL_COLUMNS:
+                if col + suffix in rows.columns:
+                    out[col] = _as_text(rows[col + suffix])
+            tables[name].append(out)
+
+        # 2. Attribute transitions for employees in both snapshots
+        both = merged[merged['_merge'] == 'both']
+        for col in TRACKED_COLUMNS:
+            if col not in both.columns or col + '_prev' not in both.columns:
+                continue
+            before, after = _as_text(both[col + '_prev']), _as_text(both[col])
+            changed = both[(before != after) & ~(before.isna() & after.isna())]
+            if changed.empty:
+                continue
+            tables["transitions"].append(pd.DataFrame({
+                'report_date': date,
+                'previous_date': prev_date,
+                'employee_id': changed['employee_id'],
+                'employee_name': _as_text(changed['employee_name']) if 'employee_name' in changed.columns else None,
+                'column': col,
+                'from_value': _as_text(changed[col + '_prev']),
+                'to_value': _as_text(changed[col]),
+            }))
+
+    columns = {
+        "joiners": empty_detail,
+        "leavers": empty_detail,
+        "transitions": ['report_date', 'previous_date', 'employee_id', 'employee_name', 'column', 'from_value', 'to_value'],
+    }
+    return {
+        name: pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=columns[name])
+        for name, parts in tables.items()
+    }
+
+def describe_change_tables(tables):
+    """
+    One line per table for the prompt's data context.
+    """
+    lines = []
+    for name, table in tables.items():
+        line = f"{name}: {len(table)} rows"
+        if name == "transitions" and not table.empty:
+            counts = table['column'].value_counts()
+            line += " (" + ", ".join(f"{col}: {n}" for col, n in counts.items()) + ")"
+        lines.append(line)
+    return "WEEK-OVER-WEEK CHANGE TABLES: " + "; ".join(lines)
@@ -0,0 +1,103 @@
+import pandas as pd
+from pandas.api.types import (
+    CategoricalDtype, is_bool_dtype, is_float_dtype, is_integer_dtype, is_object_dtype, is_string_dtype
+)
+
+# Columns holding identifiers (normalized to one dtype across files)
+ID_COLUMNS = ['employee_id']
+
+# Low-cardinality text columns stored as 'category'. Names, emails and other
+# free text stay str: they repeat every week, but generated code fills,
+# assigns and concatenates them, which categoricals reject.
+CATEGORY_COLUMNS = [
+    'designation', 'office_location', 'category', 'deployment_status', 'status', 'spine_current_status',
+]
+
+def memory_mb(frames):
+    """
+    Returns the deep memory footprint of a list of DataFrames in MB.
+    """
+    return sum(df.memory_usage(deep=True).sum() for df in frames) / (1024 * 1024)
+
+def _is_text(s):
+    if isinstance(s.dtype, (CategoricalDtype, pd.StringDtype)):
+        return True
+    if not (is_object_dtype(s.dtype) or is_string_dtype(s.dtype)):
+        return False
+    return s.dropna().map(type).eq(str).all()
+
+def categorize_frames(frames, columns=CATEGORY_COLUMNS):
+    """
+    Converts the given low-cardinality text columns to 'category' with ONE
+    dtype shared by every frame, so the following pd.concat keeps them
+    categorical. A column qualifies when it is pure text in every frame.
+    """
+    if sum(len(df) for df in frames) == 0:
+        return frames
+
+    dtypes = {}
+    for col in columns:
+        series = [df[col] for df in frames if col in df.columns]
+        if not series or not all(_is_text(s) for s in series):
+            continue
+        values = set()
+        for s in series:
+            if isinstance(s.dtype, CategoricalDtype):
+                values.update(s.cat.categories)
+            else:
+                values.update(s.dropna().unique())
+        dtypes[col] = CategoricalDtype(sorted(values))
+
+    out = []
+    for df in frames:
+        cols = {c: t for c, t in dtypes.items() if c in df.columns and df[c].dtype != t}
+        out.append(df.astype(cols) if cols else df)
+    return out
+
+def downcast_numerics(df):
+    """
+    Downcasts integer columns to the smallest integer type and float columns
+    to float32 when that is lossless.
+    """
+    for col in df.columns:
+        s = df[col]
+        if is_bool_dtype(s.dtype):
+            continue
+        if is_integer_dtype(s.dtype) and not isinstance(s.dtype, pd.api.extensions.ExtensionDtype):
+            df[col] = pd.to_numeric(s, downcast='integer')
+        elif is_float_dtype(s.dtype) and s.dtype != 'float32':
+            s32 = s.astype('float32')
+            if ((s32.astype(s.dtype) == s) | s.isna()).all():
+                df[col] = s32
+    return df
+
+def normalize_ids(df, id_cols=ID_COLUMNS):
+    """
+    Gives ID columns one dtype: integers when every ID is integral
+    (e.g. 1001 / 1001.0 / ' 1001'), stripped strings otherwise.
+    """
+    for col in id_cols:
+        if col not in df.columns:
+            continue
+        s = df[col]
+        num = pd.to_numeric(s, errors='coerce')
+        if num.notna().sum() == s.notna().sum() and (num.dropna() % 1 == 0).all():
+            if num.isna().any():
+                df[col] = num.astype('Int64')
+            else:
+                df[col] = pd.to_numeric(num.astype('int64'), downcast='integer')
+        else:
+            text = s.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+            df[col] = text.where(s.notna())
+    return df
+
+def compact_concat(frames):
+    """
+    Concatenates frames into one memory-compact DataFrame.
+    Returns (df, before_mb, after_mb).
+    """
+    before = memory_mb(frames)
+    frames = categorize_frames(frames)
+    df = pd.concat(frames, ignore_index=True)
+    df = normalize_ids(downcast_numerics(df))
+    return df, before, memory_mb([df])
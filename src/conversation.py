@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from .prompt_builder import count_tokens
+
+# Size limits for one history entry
+HEAD_ROWS = 3
+MAX_COLUMNS = 12
+MAX_ITEMS = 5
+MAX_TEXT_CHARS = 300
+MAX_CODE_LINES = 15
+
+def _clip(text, limit=MAX_TEXT_CHARS):
+    text = str(text)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def _column_list(columns):
+    names = [str(c) for c in columns]
+    if len(names) > MAX_COLUMNS:
+        names = names[:MAX_COLUMNS] + [f"... (+{len(names) - MAX_COLUMNS} more)"]
+    return ", ".join(names)
+
+def summarize_result(result):
+    """
+    Compact description of an execution result for the chat history:
+    type and shape, column names and the first rows for tables, the first
+    items for lists, the value itself for scalars. Bounded in size no matter
+    how large the result is.
+    """
+    if hasattr(result, "savefig") or hasattr(getattr(result, "figure", None), "savefig"):
+        return "matplotlib chart"
+    if hasattr(result, "to_json") and hasattr(result, "to_plotly_json"):
+        title = getattr(getattr(result.layout, "title", None), "text", None)
+        return f"plotly chart ({title})" if title else "plotly chart"
+    if isinstance(result, pd.DataFrame):
+        head = result.head(HEAD_ROWS).to_string(max_cols=MAX_COLUMNS, max_colwidth=30)
+        return (f"DataFrame {result.shape[0]} rows x {result.shape[1]} columns [{_column_list(result.columns)}]\n"
+                f"{_clip(head, MAX_TEXT_CHARS * 3)}")
+    if isinstance(result, pd.Series):
+        head = result.head(MAX_ITEMS).to_string(max_rows=MAX_ITEMS)
+        name = f" '{result.name}'" if result.name is not None else ""
+        return f"Series{name} of {len(result)} values\n{_clip(head)}"
+    if isinstance(result, (list, tuple, set)):
+        items = list(result)
+        shown = ", ".join(_clip(repr(x), 60) for x in items[:MAX_ITEMS])
+        more = f", ... (+{len(items) - MAX_ITEMS} more)" if len(items) > MAX_ITEMS else ""
+        return f"{type(result).__name__} of {len(items)} items: [{shown}{more}]"
+    if isinstance(result, dict):
+        shown = ", ".join(f"{_clip(k, 40)}: {_clip(v, 60)}" for k, v in list(result.items())[:MAX_ITEMS])
+        more = f", ... (+{len(result) - MAX_ITEMS} more)" if len(result) > MAX_ITEMS else ""
+        return f"dict of {len(result)} entries: {{{shown}{more}}}"
+    if isinstance(result, np.generic):
+        result = result.item()
+    return _clip(result)
+
+def _clip_code(code):
+    lines = code.strip().splitlines()
+    if len(lines) > MAX_CODE_LINES:
+        lines = lines[:MAX_CODE_LINES] + [f"# ... ({len(lines) - MAX_CODE_LINES} more lines)"]
+    return "\n".join(lines)
+
+def history_entry(question, result, code=None):
+    """
+    The user/assistant message pair recorded for one answered question.
+    """
+    answer = {"role": "assistant", "content": summarize_result(result)}
+    if code:
+        answer["code"] = _clip_code(code)
+    return [{"role": "user", "content": question}, answer]
+
+def format_message(msg):
+    text = f"{msg['role'].title()}: {msg['content']}\n"
+    if msg.get("code"):
+        text += f"Code:\n{msg['code']}\n"
+    return text
+
+def format_history(messages, budget):
+    """
+    Renders the most recent messages that fit in `budget` tokens, oldest
+    first. Whole messages are dropped, never cut mid-way.
+    """
+    kept = []
+    used = 0
+    for msg in reversed(messages):
+        text = format_message(msg)
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            break
+        kept.append(text)
+        used += tokens
+    return "".join(reversed(kept))
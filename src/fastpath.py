@@ -0,0 +1,219 @@
+import re
+import pandas as pd
+from .aliases import LOCATION_ALIASES, LOCATION_NAMES
+
+COUNT_WORDS = {"how", "many", "count", "number", "headcount", "total", "strength"}
+COMPARE_WORDS = {"compare", "comparison", "vs", "versus", "change", "changed", "difference"}
+PREVIOUS_WORDS = {"last", "previous", "prior"}
+
+# Filler words that don't change the meaning of a count question
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "at", "on", "for", "from", "to", "and", "is", "are", "there", "we",
+    "do", "does", "have", "has", "our", "what", "whats", "s", "people", "person", "employees", "employee",
+    "staff", "resources", "current", "currently", "now", "today", "office", "location", "based",
+    "week", "this", "latest", "number", "as", "me", "give", "tell", "please", "present", "working",
+}
+
+# Anything that asks for more than a number goes to the LLM
+DISQUALIFY = {
+    "list", "show", "display", "plot", "chart", "graph", "names", "name", "who", "which", "why",
+    "trend", "history", "percentage", "percent", "average", "ratio", "them", "those", "these",
+    "they", "their", "it", "that", "except", "not", "without", "excluding", "all", "or",
+}
+
+def _norm(value):
+    return re.sub(r"[^a-z0-9]", "", str(value).lower())
+
+def _find_value(values, target):
+    """
+    Returns the first value whose normalized form equals target, else None.
+    """
+    return next((v for v in values if _norm(v) == target), None)
+
+def match_question(question, key_values, dates=(), aliases=None):
+    """
+    Matches a question against the count / breakdown / week-over-week templates
+    of the golden library. key_values maps column -> all observed values;
+    dates are the report dates, oldest first ('last week' is dates[-2]);
+    aliases is the dataset's alias index (locations resolve to location_group).
+    Returns a dict with 'intent', the filled slots and a 'confidence' in [0, 1],
+    or None when the question clearly isn't a template question.
+    """
+    text = question.lower()
+    words = re.findall(r"[a-z0-9]+", text)
+    if not words or DISQUALIFY.intersection(words):
+        return None
+    if not (COUNT_WORDS.intersection(words) or COMPARE_WORDS.intersection(words)):
+        return None
+
+    used = set()
+    slots = {}
+
+    # Status flags
+    if re.search(r"\bnon[\s-]?billable\b", text):
+        value = _find_value(key_values.get("deployment_status", []), "nonbillable")
+        if value is None:
+            return None
+        slots["deployment_status"] = value
+        used.update({"non", "billable", "nonbillable"})
+    if "bench" in words:
+        value = _find_value(key_values.get("spine_current_status", []), "available")
+        if value is None:
+            return None
+        slots["spine_current_status"] = value
+        used.update({"bench", "strength", "available"})
+    if re.search(r"\binterns?\b", text):
+        value = _find_value(key_values.get("category", []), "intern")
+        if value is not None:
+            slots["category"] = value
+            used.update({"intern", "interns"})
+
+    # Designation (longest match first so 'Senior Consultant' wins over 'Consultant')
+    if "category" not in slots:
+        for value in sorted(key_values.get("designation", []), key=lambda v: -len(str(v))):
+            phrase = str(value).lower()
+            pattern = r"\b" + r"\s+".join(map(re.escape, phrase.split())) + r"s?\b"
+            if re.search(pattern, text):
+                slots["designation"] = value
+                used.update(re.findall(r"[a-z0-9]+", phrase))
+                used.update(w + "s" for w in re.findall(r"[a-z0-9]+", phrase))
+                break
+
+    # Location -> canonical location groups: a group or raw value named in
+    # full, then a city spelling or abbreviation (same tables as the prompt)
+    groups = [str(g) for g in key_values.get("location_group", [])]
+    raw_groups = (aliases or {}).get("location_group", {})
+    named = [(g, g) for g in groups] + [(str(v), g) for v, g in raw_groups.items()]
+    for value, group in sorted(named, key=lambda n: -len(n[0])):
+        if re.search(r"\b" + r"[^a-z0-9]+".join(re.findall(r"[a-z0-9]+", value.lower())) + r"\b", text):
+            slots["location_groups"] = [group]
+            used.update(re.findall(r"[a-z0-9]+", value.lower()))
+            break
+    if "location_groups" not in slots:
+        for word in words:
+            matched = [g for g in LOCATION_ALIASES.get(word.upper(), [LOCATION_NAMES.get(word)]) if g in groups]
+            if matched:
+                slots["location_groups"] = matched
+                used.add(word)
+                break
+
+    # Specific report date (YYYY-MM-DD)
+    date_match = re.search(r"\b(\d{4})-(\d{2})-(\d{2})\b", text)
+    if date_match:
+        date = pd.Timestamp(date_match.group(0))
+        if date not in dates:
+            return None
+        slots["report_date"] = date
+        used.update(date_match.groups())
+
+    # Intent
+    if COMPARE_WORDS.intersection(words):
+        # 'X vs Y' without a time frame is a multi-series question
+        if not PREVIOUS_WORDS.intersection(words):
+            return None
+        intent = "compare"
+        used.update(COMPARE_WORDS | PREVIOUS_WORDS)
+    elif COUNT_WORDS.intersection(words):
+        intent = "count"
+        # 'last week' / 'previous report': count on the report before the latest
+        if PREVIOUS_WORDS.intersection(words):
+            dates = list(dates)
+            if "report_date" in slots or len(dates) < 2:
+                return None
+            slots["report_date"] = dates[-2]
+            used.update(PREVIOUS_WORDS)
+    else:
+        return None
+    used.update(COUNT_WORDS)
+
+    # Only words that carry a filter count towards confidence
+    content = [w for w in words if w not in STOPWORDS | COUNT_WORDS | COMPARE_WORDS | PREVIOUS_WORDS]
+    unexplained = [w for w in content if w not in used]
+    confidence = 1.0 - len(unexplained) / max(1, len(content))
+    return {"intent": intent, "slots": slots, "confidence": confidence, "unexplained": unexplained}
+
+def _filter(df, slots):
+    """
+    Applies the exact-match slots as one vectorized mask.
+    """
+    mask = pd.Series(True, index=df.index)
+    for col in ("designation", "category", "deployment_status", "spine_current_status"):
+        if col in slots:
+            mask &= df[col] == slots[col]
+    return df[mask]
+
+def _count(df):
+    return int(df['employee_id'].nunique()) if 'employee_id' in df.columns else len(df)
+
+def _filter_steps(slots, locations=None):
+    steps = []
+    labels = {
+        "designation": "Designation", "category": "Category",
+        "deployment_status": "Deployment Status", "spine_current_status": "sPInE Current status",
+    }
+    for col, label in labels.items():
+        if col in slots:
+            steps.append(f"Filter '{label}' to '{slots[col]}'.")
+    if locations is not None:
+        groups = ", ".join(repr(str(g)) for g in slots["location_groups"])
+        steps.append(f"Filter 'location_group' to {groups} (Office Locations: {', '.join(repr(str(l)) for l in locations)}).")
+    return steps
+
+def answer_match(match, df_latest, df_previous=None, snapshot=None):
+    """
+    Executes a matched template with vectorized pandas.
+    Returns {'result': ..., 'explanation': ...} in the same shape as ExcelAgent.run.
+    """
+    slots = match["slots"]
+    frame = df_latest
+    if "report_date" in slots and snapshot is not None:
+        frame = snapshot(slots["report_date"])
+
+    if match["intent"] == "compare":
+        if df_previous is None:
+            return {"result": "Not enough historical data to compare.", "explanation": "Need at least 2 report dates."}
+        counts = []
+        for snap in (df_latest, df_previous):
+            filtered = _filter(snap, slots)
+            if "location_groups" in slots:
+                filtered = filtered[_location_mask(filtered, slots["location_groups"])]
+            counts.append(_count(filtered))
+        latest = df_latest['report_date'].iloc[0].date()
+        previous = df_previous['report_date'].iloc[0].date()
+        locations = None
+        if "location_groups" in slots:
+            locations = df_latest.loc[_location_mask(df_latest, slots["location_groups"]), 'office_location'].unique().tolist()
+        steps = [f"Filter 'report_date' for {latest} vs {previous}."] + _filter_steps(slots, locations)
+        steps.append("Count unique 'employee_id' in each.")
+        return {
+            "result": f"Latest ({latest}): {counts[0]}\nPrevious ({previous}): {counts[1]}\nChange: {counts[0] - counts[1]:+}",
+            "explanation": " ".join(steps),
+        }
+
+    filtered = _filter(frame, slots)
+    date_step = [f"Filter 'report_date' to {slots['report_date'].date()}."] if "report_date" in slots else []
+    if "location_groups" not in slots:
+        steps = date_step + _filter_steps(slots) + ["Count unique Employee IDs."]
+        return {"result": _count(filtered), "explanation": " ".join(steps)}
+
+    # 1. Identify ALL matching locations first, 2. breakdown with zeros
+    all_locs = frame.loc[_location_mask(frame, slots["location_groups"]), 'office_location'].dropna().unique().tolist()
+    matches = filtered[filtered['office_location'].isin(all_locs)]
+    steps = date_step + _filter_steps(slots, all_locs) + ["Count unique Employee IDs."]
+    if len(all_locs) > 1:
+        if 'employee_id' in matches.columns:
+            breakdown = matches.groupby('office_location', observed=True)['employee_id'].nunique()
+        else:
+            breakdown = matches.groupby('office_location', observed=True).size()
+        breakdown = breakdown.reindex(all_locs, fill_value=0)
+        breakdown_str = "\n".join(f"- {k}: {v}" for k, v in breakdown.items())
+        result = f"Total: {_count(matches)}\n{breakdown_str}"
+    else:
+        result = _count(matches)
+    return {"result": result, "explanation": " ".join(steps)}
+
+def _location_mask(df, groups):
+    """
+    Rows whose canonical location_group is one of `groups`.
+    """
+    return df['location_group'].isin(groups)
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from .compact import categorize_frames, downcast_numerics, normalize_ids, memory_mb
+from .snapshots import SnapshotCache
+
+class HistoryStore:
+    """
+    Employee history encoded as validity intervals.
+
+    Each row holds one version of an employee's attributes together with the
+    first and last report dates it was seen unchanged (`valid_from` /
+    `valid_to`, inclusive). Weeks where nothing changed for an employee cost
+    nothing, so a long history takes roughly headcount + changes rows instead
+    of headcount x weeks. Single-date snapshots and the full multi-week frame
+    are materialized on demand with the original column layout.
+    """
+    kind = "history"
+
+    def __init__(self, intervals, dates, columns, dtypes, snapshot_cache=4):
+        self.intervals = intervals
+        self.dates = dates  # sorted pd.Timestamps
+        self.columns = columns  # column order of the materialized frames
+        self.dtypes = dtypes
+        self._attr_cols = [c for c in columns if c != 'report_date']
+        self._from = intervals['valid_from'].to_numpy()
+        self._to = intervals['valid_to'].to_numpy()
+        self._snapshots = SnapshotCache(snapshot_cache)
+
+    @classmethod
+    def from_snapshots(cls, snapshots):
+        """
+        Encodes [(report_date, frame), ...] (oldest first, one frame per date).
+        A row continues an open interval when the same employee (and the same
+        occurrence, for repeated IDs) had identical attributes on the
+        previous report date.
+        """
+        dates = [pd.Timestamp(d) for d, _ in snapshots]
+        frames = categorize_frames([frame for _, frame in snapshots])
+        columns = []
+        for frame in frames:
+            columns += [c for c in frame.columns if c not in columns]
+        attr_cols = [c for c in columns if c != 'report_date']
+
+        pieces = []  # new interval rows, in creation order
+        valid_from, valid_to = [], []
+        open_keys = None  # (employee_id, occurrence, row hash) -> interval id, for the previous date
+        next_id = 0
+        for date, frame in zip(dates, frames):
+            frame = frame.reset_index(drop=True).reindex(columns=attr_cols)
+            keys = pd.DataFrame({
+                'employee_id': frame['employee_id'] if 'employee_id' in frame.columns else np.arange(len(frame)),
+                'occurrence': frame.groupby('employee_id', dropna=False, sort=False).cumcount()
+                if 'employee_id' in frame.columns else 0,
+                'row_hash': pd.util.hash_pandas_object(frame, index=False).to_numpy(),
+            })
+
+            if open_keys is not None:
+                matched = keys.merge(open_keys, on=['employee_id', 'occurrence', 'row_hash'], how='left')['interval']
+                ids = matched.to_numpy(dtype='float64', copy=True)
+            else:
+                ids = np.full(len(frame), np.nan)
+
+            continuing = ~np.isnan(ids)
+            for interval in ids[continuing].astype(np.int64):
+                valid_to[interval] = date
+
+            new = ~continuing
+            n_new = int(new.sum())
+            if n_new:
+                pieces.append(frame[new])
+                valid_from += [date] * n_new
+                valid_to += [date] * n_new
+                ids[new] = np.arange(next_id, next_id + n_new)
+                next_id += n_new
+
+            keys['interval'] = ids.astype(np.int64)
+            open_keys = keys
+
+        intervals = pd.concat(pieces, ignore_index=True) if pieces else pd.DataFrame(columns=attr_cols)
+        intervals = normalize_ids(downcast_numerics(intervals))
+        intervals['valid_from'] = pd.to_datetime(pd.Series(valid_from, dtype='object'))
+        intervals['valid_to'] = pd.to_datetime(pd.Series(valid_to, dtype='object'))
+
+        dtypes = intervals[attr_cols].dtypes.copy()
+        report_dtype = frames[0]['report_date'].dtype if frames and 'report_date' in frames[0].columns else 'datetime64[us]'
+        dtypes['report_date'] = report_dtype
+        dtypes = dtypes.reindex(columns)
+        return cls(intervals, dates, columns, dtypes)
+
+    def row_count(self, date):
+        date = np.datetime64(pd.Timestamp(date))
+        return int(((self._from <= date) & (self._to >= date)).sum())
+
+    def _build_snapshot(self, date):
+        mask = (self._from <= np.datetime64(date)) & (self._to >= np.datetime64(date))
+        out = self.intervals.loc[mask, self._attr_cols].reset_index(drop=True)
+        if 'report_date' in self.columns:
+            out.insert(self.columns.index('report_date'), 'report_date',
+                       pd.Series(date, index=out.index).astype(self.dtypes['report_date']))
+        return out
+
+    def snapshot(self, date):
+        """
+        Rows of one report date, same columns as the original frame (recent
+        dates come from the snapshot cache).
+        """
+        return self._snapshots.get(pd.Timestamp(date), self._build_snapshot)
+
+    def materialize(self):
+        """
+        The full multi-week frame (oldest report first), rebuilt on each call.
+        """
+        frames = [self._build_snapshot(d) for d in self.dates]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.columns)
+
+    def memory_mb(self):
+        return memory_mb([self.intervals])
@@ -0,0 +1,202 @@
+import os
+import datetime
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from python_calamine import CalamineWorkbook
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+TRACKER_SHEET = "Availability Tracker"
+
+# Standard tracker columns: the projection AGENT_LOAD_COLUMNS=tracker opts into
+TRACKER_COLUMNS = [
+    "employee_id", "employee_name", "email_id", "designation", "office_location", "category",
+    "deployment_status", "status", "spine_current_status", "reporting_manager",
+    "date_of_joining", "last_working_day",
+]
+DATE_COLUMNS = {"date_of_joining", "last_working_day"}
+
+# Renaming bad headers
+RENAME_MAP = {
+    "emplo+a514+a1+a1:n18": "employee_id",
+    "rm_name": "reporting_manager",
+    "lwd": "last_working_day"
+}
+
+def standardize_columns(columns):
+    """
+    Converts raw Excel headers to snake_case and fixes known bad headers.
+    """
+    cols = [
+        str(col).strip().lower()
+        .replace(" ", "_").replace("-", "_").replace("/", "_").replace(".", "")
+        for col in columns
+    ]
+    return [RENAME_MAP.get(col, col) for col in cols]
+
+def configured_columns():
+    """
+    Columns to keep from each workbook. None (the default, or "*") keeps
+    everything; AGENT_LOAD_COLUMNS=tracker keeps TRACKER_COLUMNS, any other
+    value is a comma-separated list of normalized names.
+    """
+    value = (os.getenv("AGENT_LOAD_COLUMNS") or "").strip()
+    if value in ("", "*"):
+        return None
+    if value.lower() == "tracker":
+        return list(TRACKER_COLUMNS)
+    return [col.strip() for col in value.split(",") if col.strip()]
+
+def reader_key(columns):
+    """
+    Identifies the reader output for cache validation (a different column
+    set must not be served from frames cached with another).
+    """
+    return "all" if columns is None else ",".join(columns)
+
+def _resolve_sheet(sheet_names):
+    # 'Availability Tracker' if present, else the first sheet
+    return TRACKER_SHEET if TRACKER_SHEET in sheet_names else sheet_names[0]
+
+def _iter_rows(f_path):
+    """
+    Opens the workbook once and yields the tracker sheet's rows as tuples:
+    calamine when installed, else openpyxl in read-only (streaming) mode.
+    """
+    if HAS_CALAMINE:
+        workbook = CalamineWorkbook.from_path(f_path)
+        sheet = workbook.get_sheet_by_name(_resolve_sheet(workbook.sheet_names))
+        yield from sheet.to_python(skip_empty_area=False)
+        return
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(f_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[_resolve_sheet(workbook.sheetnames)]
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _coerce(col, value):
+    """
+    Per-cell type coercion while streaming: blanks -> None, integral float
+    IDs -> int, dates kept as datetimes (unparseable text left to to_datetime).
+    """
+    if value is None or value == "":
+        return None
+    if col in DATE_COLUMNS:
+        if isinstance(value, (datetime.datetime, datetime.date, str)):
+            return value
+        return None
+    if col == "employee_id" and isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _read_streaming(f_path, columns):
+    rows = _iter_rows(f_path)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame(columns=columns or [])
+
+    names = standardize_columns(
+        col if col not in (None, "") else f"Unnamed: {i}" for i, col in enumerate(header)
+    )
+    # Project after normalization; first occurrence wins on duplicate headers
+    keep = {}
+    for i, name in enumerate(names):
+        if name not in keep and (columns is None or name in columns):
+            keep[name] = i
+    data = {name: [] for name in keep}
+    selected = list(keep.items())
+
+    for row in rows:
+        if not any(value not in (None, "") for value in row):
+            continue  # blank / formatting-only row
+        width = len(row)
+        for name, i in selected:
+            data[name].append(_coerce(name, row[i]) if i < width else None)
+
+    df = pd.DataFrame(data)
+    for col in DATE_COLUMNS.intersection(df.columns):
+        # Same resolution whichever engine produced the values
+        df[col] = pd.to_datetime(df[col], errors='coerce').astype('datetime64[us]')
+    return df
+
+def _read_pandas(f_path, columns):
+    # Formats the streaming readers don't handle (e.g. legacy .xls)
+    with pd.ExcelFile(f_path) as workbook:
+        temp_df = workbook.parse(_resolve_sheet(workbook.sheet_names))
+    temp_df.columns = standardize_columns(temp_df.columns)
+    temp_df = temp_df.loc[:, ~temp_df.columns.duplicated()]
+    if columns is not None:
+        temp_df = temp_df[[col for col in temp_df.columns if col in columns]]
+    for col in DATE_COLUMNS.intersection(temp_df.columns):
+        temp_df[col] = pd.to_datetime(temp_df[col], errors='coerce').astype('datetime64[us]')
+    return temp_df
+
+def read_tracker(f_path, r_date, columns=None):
+    """
+    Reads a single weekly tracker workbook and returns the normalized DataFrame
+    (standardized headers, only `columns` if given, 'report_date' column,
+    parsed internal dates). The workbook is opened once and the sheet picked
+    from its sheet list ('Availability Tracker', else the first sheet).
+    """
+    if f_path.lower().endswith((".xlsx", ".xlsm")):
+        temp_df = _read_streaming(f_path, columns)
+    else:
+        temp_df = _read_pandas(f_path, columns)
+
+    # Add Report Date
+    temp_df['report_date'] = pd.to_datetime(r_date)
+
+    return temp_df
+
+def _read_tracker_job(f_path, r_date, columns=None):
+    """
+    Process pool entry point. Returns (frame, error) so one bad file
+    doesn't take the whole batch down.
+    """
+    try:
+        return read_tracker(f_path, r_date, columns), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def parse_files(file_infos, workers=1, columns=None):
+    """
+    Parses the given files (dicts with 'path' and 'date'), in a process pool
+    when workers > 1, keeping only `columns` (None = all).
+    Returns (frames, errors), both keyed by path.
+    """
+    frames = {}
+    errors = {}
+
+    if workers <= 1 or len(file_infos) <= 1:
+        for file_info in file_infos:
+            df, err = _read_tracker_job(file_info['path'], file_info['date'], columns)
+            if err:
+                errors[file_info['path']] = err
+            else:
+                frames[file_info['path']] = df
+        return frames, errors
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(file_infos))) as pool:
+        futures = {
+            pool.submit(_read_tracker_job, f['path'], f['date'], columns): f['path']
+            for f in file_infos
+        }
+        for future in as_completed(futures):
+            f_path = futures[future]
+            try:
+                df, err = future.result()
+            except Exception as e:
+                # Worker died (e.g. BrokenProcessPool)
+                df, err = None, f"{type(e).__name__}: {e}"
+            if err:
+                errors[f_path] = err
+            else:
+                frames[f_path] = df
+
+    return frames, errors
@@ -0,0 +1,86 @@
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+# Categorical columns whose values are shown to the model
+PROFILE_COLUMNS = ['office_location', 'category', 'deployment_status', 'status', 'spine_current_status', 'designation']
+
+def _py(value):
+    """
+    numpy scalar -> plain Python (JSON-serializable) value.
+    """
+    return value.item() if hasattr(value, "item") else value
+
+def profile_frame(df, value_cols=PROFILE_COLUMNS):
+    """
+    Column profile of one parsed workbook: dtypes, null counts, value counts
+    for the key categorical columns and min/max of date columns.
+    Plain JSON types only, so it can be stored in the cache manifest.
+    """
+    profile = {
+        "rows": len(df),
+        "dtypes": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        "nulls": {str(col): int(n) for col, n in df.isna().sum().items()},
+        "value_counts": {},
+        "dates": {},
+    }
+    for col in value_cols:
+        if col in df.columns:
+            counts = df[col].value_counts(dropna=True)
+            profile["value_counts"][col] = [[_py(v), int(n)] for v, n in counts.items() if n > 0]
+    for col in df.columns:
+        if is_datetime64_any_dtype(df[col].dtype):
+            s = df[col].dropna()
+            if not s.empty:
+                profile["dates"][str(col)] = [s.min().isoformat(), s.max().isoformat()]
+    return profile
+
+def merge_profiles(profiles):
+    """
+    Combines per-file profiles into one for the whole dataset. Value lists
+    come back ranked by total frequency.
+    """
+    merged = {"rows": 0, "nulls": {}, "value_counts": {}, "dates": {}}
+    for profile in profiles:
+        merged["rows"] += profile["rows"]
+        for col, n in profile["nulls"].items():
+            merged["nulls"][col] = merged["nulls"].get(col, 0) + n
+        for col, pairs in profile["value_counts"].items():
+            counts = merged["value_counts"].setdefault(col, {})
+            for value, n in pairs:
+                counts[value] = counts.get(value, 0) + n
+        for col, (lo, hi) in profile["dates"].items():
+            if col in merged["dates"]:
+                cur_lo, cur_hi = merged["dates"][col]
+                merged["dates"][col] = [min(lo, cur_lo), max(hi, cur_hi)]
+            else:
+                merged["dates"][col] = [lo, hi]
+    # Columns a file doesn't have are all-null for its rows after concat
+    columns = set().union(*(p["dtypes"] for p in profiles)) if profiles else set()
+    for profile in profiles:
+        for col in columns.difference(profile["dtypes"]):
+            merged["nulls"][col] = merged["nulls"].get(col, 0) + profile["rows"]
+    merged["ranked_values"] = {
+        col: [v for v, _ in sorted(counts.items(), key=lambda kv: -kv[1])]
+        for col, counts in merged["value_counts"].items()
+    }
+    return merged
+
+def format_schema(dtypes, merged):
+    """
+    Schema lines for the prompt: dtype, plus null counts and date ranges
+    from the merged profile.
+    """
+    lines = []
+    for col, dtype in dtypes.items():
+        line = f"- {col}: {dtype}"
+        notes = []
+        if col in merged["dates"]:
+            lo, hi = merged["dates"][col]
+            notes.append(f"{pd.Timestamp(lo).date()} to {pd.Timestamp(hi).date()}")
+        nulls = merged["nulls"].get(col, 0)
+        if nulls:
+            notes.append(f"{nulls} nulls")
+        if notes:
+            line += f" ({', '.join(notes)})"
+        lines.append(line)
+    return "\n".join(lines)
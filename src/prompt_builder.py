@@ -0,0 +1,126 @@
+import math
+from .prompts import SYSTEM_PREFIX, SYSTEM_SUFFIX, ERROR_PROMPT
+
+# Default per-section caps (tokens). The schema is never cut.
+SECTION_BUDGETS = {
+    "values": 2000,
+    "history": 1500,
+    "few_shot": 2500,
+    "question": 500,
+}
+
+def count_tokens(text):
+    """
+    Approximate token count (~4 characters per token).
+    """
+    return math.ceil(len(text) / 4)
+
+def _cap_head(text, budget):
+    """
+    Keeps the first `budget` tokens, cut at a line boundary.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    cut = text[:budget * 4]
+    return cut[:cut.rfind("\n")] if "\n" in cut else cut
+
+def _cap_tail(text, budget):
+    """
+    Keeps the last `budget` tokens (most recent chat turns), cut at a line boundary.
+    """
+    if count_tokens(text) <= budget:
+        return text
+    cut = text[-budget * 4:]
+    return cut[cut.find("\n") + 1:] if "\n" in cut else cut
+
+def _cap_examples(text, budget):
+    """
+    Drops whole few-shot examples (least similar last) until under budget.
+    """
+    examples = [e for e in text.split("\n\nQ: ") if e]
+    while examples and count_tokens("\n\nQ: ".join(examples)) > budget:
+        examples.pop()
+    return "\n\nQ: ".join(examples) if examples else "No similar examples found."
+
+class BuiltPrompt:
+    """
+    A prompt split into its reusable prefix and per-question suffix.
+    """
+    def __init__(self, version, prefix, suffix, sizes):
+        self.version = version
+        self.prefix = prefix
+        self.suffix = suffix
+        self.sizes = sizes
+
+    @property
+    def text(self):
+        return self.prefix + self.suffix
+
+    def __str__(self):
+        return self.text
+
+class PromptBuilder:
+    """
+    Assembles prompts under a token budget.
+
+    The prefix (rules, schema, valid values, constraints) only changes with the
+    data, so it is formatted once per data version and reused verbatim - a
+    stable leading block that provider-side context caching can match. The
+    suffix (chat history, few-shot examples, question) is capped per section
+    and trimmed further when the total would exceed `budget`.
+    """
+    def __init__(self, budget=12000, section_budgets=None):
+        self.budget = budget
+        self.section_budgets = dict(SECTION_BUDGETS, **(section_budgets or {}))
+        self._prefix_version = None
+        self._prefix = ""
+        self._prefix_tokens = 0
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+
+    def prefix(self, version, schema_str, values_str):
+        if version != self._prefix_version:
+            values = _cap_head(values_str, self.section_budgets["values"])
+            self._prefix = SYSTEM_PREFIX.format(schema_context=schema_str, values_context=values)
+            self._prefix_tokens = count_tokens(self._prefix)
+            self._prefix_version = version
+            self.prefix_misses += 1
+        else:
+            self.prefix_hits += 1
+        return self._prefix
+
+    def build(self, version, schema_str, values_str, history_str, few_shot, question, error=None):
+        """
+        Returns a BuiltPrompt. Pass `error` to build the self-correction prompt.
+        """
+        prefix = self.prefix(version, schema_str, values_str)
+        budgets = self.section_budgets
+
+        question = _cap_head(question, budgets["question"])
+        history_str = _cap_tail(history_str, budgets["history"])
+        few_shot = _cap_examples(few_shot, budgets["few_shot"]) if few_shot else ""
+        error_str = ERROR_PROMPT.format(error_message=_cap_head(str(error), budgets["question"])) if error else ""
+
+        # Over the total budget: shed few-shot examples first, then older history
+        fixed = self._prefix_tokens + count_tokens(question) + count_tokens(error_str) + 50
+        room = self.budget - fixed
+        if count_tokens(history_str) + count_tokens(few_shot) > room:
+            few_shot = _cap_examples(few_shot, max(0, room - count_tokens(history_str))) if few_shot else ""
+        if count_tokens(history_str) + count_tokens(few_shot) > room:
+            history_str = _cap_tail(history_str, max(0, room - count_tokens(few_shot)))
+
+        suffix = SYSTEM_SUFFIX.format(
+            chat_history=history_str,
+            few_shot_examples=few_shot,
+            user_question=question,
+        ) + error_str
+
+        sizes = {
+            "prefix": self._prefix_tokens,
+            "history": count_tokens(history_str),
+            "few_shot": count_tokens(few_shot),
+            "question": count_tokens(question),
+            "error": count_tokens(error_str),
+        }
+        sizes["total"] = sizes["prefix"] + count_tokens(suffix)
+        return BuiltPrompt(version, prefix, suffix, sizes)
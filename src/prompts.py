@@ -1,6 +1,8 @@
-from fuzzywuzzy import process
+from .retrieval import FewShotIndex
 
-SYSTEM_PROMPT = """
+# Static part of the prompt: identical for every question on the same data version,
+# so it can be formatted once and reused (and cached provider-side).
+SYSTEM_PREFIX = """
 You are an expert Python Data Analyst. Your goal is to answer questions by writing EFFICIENT and ACCURATE pandas code.
 
 You have access to a pandas DataFrame named `df`.
@@ -31,22 +33,24 @@ The dataframe contains employee availability and project allocation data.
    - If user asks for "All Consultants", match string "Consultant".
 5. **Dates & History**:
    - The dataframe contains multiple reports distinguished by `report_date` (datetime).
-   - **Default Behavior**: If the user asks about "current" status or gives no date, filter `df` to the **LATEST REPORT DATE**.
-     - Code: `latest_date = df['report_date'].max(); df_latest = df[df['report_date'] == latest_date]`
+   - **Pre-split snapshots** (already defined, do NOT recompute them from `df`):
+     - `df_latest`: rows of the LATEST REPORT DATE only.
+     - `df_previous`: rows of the report date before it (`None` if there is only one report).
+     - `partitions`: dict of `pd.Timestamp` report date -> DataFrame of that date's rows, oldest first.
+   - **Week-over-week change tables** (already built between each pair of consecutive report dates, keyed by `employee_id`):
+     - `joiners` / `leavers`: employees present on `report_date` but not on `previous_date` / the reverse. Columns: `report_date`, `previous_date`, `employee_id`, `employee_name`, `designation`, `office_location`, `deployment_status`, `spine_current_status` (leavers show their last-seen values).
+     - `transitions`: one row per employee and changed attribute. Columns: `report_date`, `previous_date`, `employee_id`, `employee_name`, `column` (one of 'deployment_status', 'spine_current_status', 'designation', 'office_location'), `from_value`, `to_value`.
+     - For "who joined / left / moved / changed" questions, filter these tables instead of joining snapshots yourself. The latest week's changes are the rows with `report_date == list(partitions)[-1]`.
+   - **Default Behavior**: If the user asks about "current" status or gives no date, use `df_latest`.
    - **History/Comparison**: If user asks for "history", "trend", "previous", or specific dates:
-     - Use `report_date` column to filter specific slices.
+     - Use `df_previous` or `partitions[pd.Timestamp('YYYY-MM-DD')]` for specific slices; `list(partitions)` gives the sorted dates.
      - Example: "Compare 2025-10-16 vs 2025-10-09".
+     - Only scan the full `df` for questions spanning many dates (e.g. a trend over all reports).
 6. **Memory**: use the provided conversation history to resolve "them", "it", "previous", etc.
-7. **Abbreviations & Mapping**:
-   - **BLR/Bangalore** -> 'Bengaluru' (or 'Bengaluru-Eco Space', etc.)
-   - **DEL/NCR** -> 'Delhi' / 'Delhi-NCR' / 'Gurgaon'
-   - **MUM/Bombay** -> 'Mumbai'
-   - **HYD** -> 'Hyderabad'
-   - **CHE/Madras** -> 'Chennai'
-   - **PUN** -> 'Pune'
-   - **KOL/Cal** -> 'Kolkata'
-   - **GGN** -> 'Gurgaon' / 'Gurugram'
-   - **Noida** -> 'Noida'
+7. **Canonical Groups & Abbreviations**:
+   - `location_group` is the canonical city of `office_location` and `designation_group` the canonical spelling of `designation` (both categorical). The raw values each group covers and the location abbreviations (BLR, NCR, GGN, ...) are listed under Valid Values.
+   - Filter places with `df['location_group'] == 'Delhi'` or `.isin([...])`, NOT `str.contains` on `office_location`. For the AMBIGUITY breakdown, count by `office_location` within the group.
+   - Groups only merge spellings of the same title: 'Consultant' and 'Senior Consultant' stay separate (rule 4).
 
 ## Schema:
 {schema_context}
@@ -54,6 +58,15 @@ The dataframe contains employee availability and project allocation data.
 ## Valid Values for Key Columns:
 {values_context}
 
+## Constraints:
+- If counting people, always use `df['employee_id'].nunique()` if `employee_id` exists, otherwise `len(df)`.
+- Drop duplicates if necessary.
+- Columns with dtype `category` filter like strings (`==`, `isin`, `.str.contains`), but their `value_counts()` also lists values with a count of 0 - drop those unless a zero breakdown is wanted.
+- `category` columns only hold their existing values: before `.fillna('...')`, assigning new text (`df.loc[mask, col] = '...'`) or building strings (`col + ' ...'`), convert with `.astype(str)` (or `.astype(object)` to keep missing values).
+"""
+
+# Per-question part of the prompt
+SYSTEM_SUFFIX = """
 ## Chat History:
 {chat_history}
 
@@ -63,11 +76,10 @@ The dataframe contains employee availability and project allocation data.
 ## Question:
 {user_question}
 
-## Constraints:
-- If counting people, always use `df['employee_id'].nunique()` if `employee_id` exists, otherwise `len(df)`.
-- Drop duplicates if necessary.
 """
 
+SYSTEM_PROMPT = SYSTEM_PREFIX + SYSTEM_SUFFIX
+
 ERROR_PROMPT = """
 The previous code failed with this error:
 {error_message}
@@ -75,16 +87,41 @@ The previous code failed with this error:
 Fix the code. Return ONLY the fixed Python code.
 """
 
+# Targeted fix for code that failed static validation (sent without the full context)
+REPAIR_PROMPT = """
+This pandas code answers a question about a DataFrame `df` (also available: `df_latest`, `df_previous`, `partitions`, `joiners`, `leavers`, `transitions`), but it has problems:
+{problems}
+
+Code:
+{code}
+
+Columns of `df`: {columns}
+{values}
+Fix ONLY these problems and keep everything else unchanged. The code must assign `result` and `explanation`.
+Return ONLY the fixed Python code.
+"""
+
+# Appended to the schema with the DuckDB backend (AGENT_BACKEND=duckdb)
+SQL_CONTEXT = """
+## SQL Engine:
+The data is stored as one Parquet file per report date. `sql(query)` runs DuckDB SQL and returns a pandas DataFrame.
+Tables: `tracker` (every report, same columns as `df`), `joiners`, `leavers`, `transitions`.
+- Prefer `sql(...)` over `df` for counts, filters and aggregations across weeks; `df` is read from disk on every use.
+- Filter on `report_date` (e.g. `WHERE report_date = (SELECT max(report_date) FROM tracker)` or `report_date = DATE '2025-01-06'`) - only the matching weeks are read.
+- Quote column names that aren't plain identifiers ("office_location" is fine); compare text with `=` / `IN (...)` / `ILIKE`.
+- Still assign `result` and `explanation` in Python, e.g. `result = sql("SELECT count(DISTINCT employee_id) AS n FROM tracker WHERE report_date = (SELECT max(report_date) FROM tracker)")['n'].iloc[0]`.
+"""
+
 # Golden Queries Library (Question -> Code pattern)
 # These are "known good" patterns for this specific excel structure
 GOLDEN_QUERIES = [
     {
         "q": "How many consultants in Delhi?",
-        "code": "term = 'Delhi'\n# 1. Identify ALL matching locations first\nall_locs = df[df['office_location'].str.contains(term, case=False, na=False)]['office_location'].unique()\n\n# 2. Filter for Consultant\nconsultants = df[df['designation'] == 'Consultant']\n\n# 3. Filter for Location in that set\nmatches = consultants[consultants['office_location'].isin(all_locs)]\n\n# 4. Breakdown with Zeros (reindex)\nbreakdown = matches['office_location'].value_counts().reindex(all_locs, fill_value=0)\n\nif len(all_locs) > 1:\n    breakdown_str = '\\n'.join([f'- {k}: {v}' for k,v in breakdown.items()])\n    result = f\"Total: {len(matches)}\\n{breakdown_str}\"\n    explanation = f\"Step 1: Identify locations matching '{term}': {', '.join(all_locs)}. Step 2: Filter 'Designation' to 'Consultant'. Step 3: Count unique IDs for each location.\"\nelse:\n    result = len(matches)\n    explanation = f\"Filter 'Designation' to 'Consultant' and 'Office Location' to '{term}'.\""
+        "code": "term = 'Delhi'\n# 1. Identify ALL raw locations in the group first\nin_group = df['location_group'] == term\nall_locs = df.loc[in_group, 'office_location'].dropna().unique()\n\n# 2. Filter for Consultant within the group\nmatches = df[in_group & (df['designation'] == 'Consultant')]\n\n# 3. Breakdown with Zeros (reindex)\nbreakdown = matches['office_location'].value_counts().reindex(all_locs, fill_value=0)\n\nif len(all_locs) > 1:\n    breakdown_str = '\\n'.join([f'- {k}: {v}' for k,v in breakdown.items()])\n    result = f\"Total: {len(matches)}\\n{breakdown_str}\"\n    explanation = f\"Step 1: Identify locations matching '{term}': {', '.join(all_locs)}. Step 2: Filter 'Designation' to 'Consultant'. Step 3: Count unique IDs for each location.\"\nelse:\n    result = len(matches)\n    explanation = f\"Filter 'Designation' to 'Consultant' and 'Office Location' to '{term}'.\""
     },
     {
         "q": "How many non-billable people are in Delhi?",
-        "code": "df_filtered = df[(df['office_location'].str.contains('Delhi', case=False, na=False)) & (df['deployment_status'] == 'NON BILLABLE')]\nresult = df_filtered['employee_id'].nunique()\nexplanation = \"Filter 'Office Location' for 'Delhi' (matches Delhi, Delhi-NCR) and 'Deployment Status' for 'NON BILLABLE'. Count unique Employee IDs.\""
+        "code": "df_filtered = df[(df['location_group'] == 'Delhi') & (df['deployment_status'] == 'NON BILLABLE')]\nresult = df_filtered['employee_id'].nunique()\nexplanation = \"Filter 'Office Location' for 'Delhi' (matches Delhi, Delhi-NCR) and 'Deployment Status' for 'NON BILLABLE'. Count unique Employee IDs.\""
     },
     {
         "q": "List all people in Mumbai office",
@@ -104,7 +141,15 @@ GOLDEN_QUERIES = [
     },
     {
         "q": "Compare the number of consultants last week vs this week",
-        "code": "# Get sorted unique dates\ndates = sorted(df['report_date'].unique())\nif len(dates) < 2:\n    result = \"Not enough historical data to compare.\"\n    explanation = \"Need at least 2 report dates.\"\nelse:\n    latest = dates[-1]\n    previous = dates[-2]\n    \n    # Filter for Consultant\n    cons_latest = df[(df['report_date'] == latest) & (df['designation'] == 'Consultant')]['employee_id'].nunique()\n    cons_prev = df[(df['report_date'] == previous) & (df['designation'] == 'Consultant')]['employee_id'].nunique()\n    \n    diff = cons_latest - cons_prev\n    result = f\"Latest ({latest.date()}): {cons_latest}\\nPrevious ({previous.date()}): {cons_prev}\\nChange: {diff:+}\"\n    explanation = f\"Filter 'report_date' for {latest.date()} vs {previous.date()}. Count unique 'employee_id' for 'Consultant' in each.\""
+        "code": "if df_previous is None:\n    result = \"Not enough historical data to compare.\"\n    explanation = \"Need at least 2 report dates.\"\nelse:\n    latest, previous = list(partitions)[-1], list(partitions)[-2]\n    \n    # Filter for Consultant in each snapshot\n    cons_latest = df_latest[df_latest['designation'] == 'Consultant']['employee_id'].nunique()\n    cons_prev = df_previous[df_previous['designation'] == 'Consultant']['employee_id'].nunique()\n    \n    diff = cons_latest - cons_prev\n    result = f\"Latest ({latest.date()}): {cons_latest}\\nPrevious ({previous.date()}): {cons_prev}\\nChange: {diff:+}\"\n    explanation = f\"Filter 'report_date' for {latest.date()} vs {previous.date()}. Count unique 'employee_id' for 'Consultant' in each.\""
+    },
+    {
+        "q": "Who joined this week?",
+        "code": "if df_previous is None:\n    result = \"Not enough historical data to compare.\"\n    explanation = \"Need at least 2 report dates.\"\nelse:\n    latest = list(partitions)[-1]\n    result = joiners[joiners['report_date'] == latest][['employee_id', 'employee_name', 'designation', 'office_location']]\n    explanation = f\"Employee IDs present in the {latest.date()} report but not in the previous one. Compare the 'Employee ID' columns of both sheets.\""
+    },
+    {
+        "q": "Who moved from billable to non-billable this week?",
+        "code": "if df_previous is None:\n    result = \"Not enough historical data to compare.\"\n    explanation = \"Need at least 2 report dates.\"\nelse:\n    latest = list(partitions)[-1]\n    moves = transitions[(transitions['report_date'] == latest) & (transitions['column'] == 'deployment_status')]\n    # Blank statuses are None - na=False keeps the masks boolean\n    moves = moves[moves['from_value'].str.upper().str.contains('BILLABLE', na=False) & ~moves['from_value'].str.upper().str.contains('NON', na=False)\n                  & moves['to_value'].str.upper().str.contains('NON', na=False)]\n    result = moves[['employee_id', 'employee_name', 'from_value', 'to_value']]\n    explanation = f\"For employees in both the {latest.date()} report and the previous one, compare 'Deployment Status': previously BILLABLE, now NON BILLABLE.\""
     },
     {
         "q": "Show a bar chart of consultants by location",
@@ -112,27 +157,28 @@ GOLDEN_QUERIES = [
     },
     {
         "q": "List all consultants in Mumbai",
-        "code": "result = df[(df['designation'] == 'Consultant') & (df['office_location'].str.contains('Mumbai', case=False, na=False))][['employee_id', 'employee_name', 'email_id', 'office_location']]\nexplanation = \"Filter 'Designation' to 'Consultant' and 'Office Location' to 'Mumbai'. Return relevant columns.\""
+        "code": "result = df[(df['designation'] == 'Consultant') & (df['location_group'] == 'Mumbai')][['employee_id', 'employee_name', 'email_id', 'office_location']]\nexplanation = \"Filter 'Designation' to 'Consultant' and 'Office Location' to 'Mumbai'. Return relevant columns.\""
     }
 ]
 
-def get_few_shot_examples(user_question, k=3):
+# Built once at import; agents extend their own copy with harvested examples
+GOLDEN_INDEX = FewShotIndex(GOLDEN_QUERIES)
+
+def get_few_shot_examples(user_question, k=3, index=None, min_score=0.2):
     """
     Returns the top k most similar golden queries formatted as a string.
     """
-    questions = [g['q'] for g in GOLDEN_QUERIES]
+    index = index or GOLDEN_INDEX
     
-    # Check for empty questions list to avoid extraction error
-    if not questions:
+    # Check for empty library to avoid an empty search
+    if not index.examples:
         return "No examples available."
 
-    matches = process.extract(user_question, questions, limit=k)
+    matches = index.search(user_question, k=k)
     
     examples_str = ""
-    for match_q, score in matches:
-        if score > 50: # Only include relevant ones
-            # Find the code for this question
-            match_code = next(g['code'] for g in GOLDEN_QUERIES if g['q'] == match_q)
+    for match_q, match_code, score in matches:
+        if score > min_score: # Only include relevant ones
             examples_str += f"Q: {match_q}\nA:\n```python\n{match_code}\n```\n\n"
             
     return examples_str if examples_str else "No similar examples found."
@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+
+def estimate_tokens(text, expected_output=500):
+    """
+    Rough token count for a prompt (~4 characters per token) plus the
+    expected size of the generated code.
+    """
+    return len(text) // 4 + expected_output
+
+class _Bucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class RateLimiter:
+    """
+    Client-side token bucket for requests-per-minute and tokens-per-minute.
+
+    Callers are served strictly in arrival order (ticket queue), so a burst of
+    sessions can't starve an earlier request. A caller that stops waiting
+    (exception, interrupted thread) gives up its ticket. A limit of 0 disables
+    that bucket.
+    """
+    def __init__(self, rpm=60, tpm=1_000_000):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._buckets = [
+            (_Bucket(limit), kind) for limit, kind in ((rpm, "requests"), (tpm, "tokens")) if limit > 0
+        ]
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._abandoned = set()  # tickets whose caller left before being served
+        self._waits = deque(maxlen=1000)
+        self.requests = 0
+        self.total_wait = 0.0
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until one request of `tokens` tokens fits both budgets.
+        Returns the time spent waiting in seconds.
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            try:
+                while True:
+                    if ticket == self._serving:
+                        now = time.monotonic()
+                        wait = 0.0
+                        for bucket, kind in self._buckets:
+                            bucket.refill(now)
+                            wait = max(wait, bucket.wait_time(1 if kind == "requests" else tokens))
+                        if wait == 0.0:
+                            break
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                # Don't leave later callers waiting for a ticket nobody will take
+                if ticket == self._serving:
+                    self._advance()
+                else:
+                    self._abandoned.add(ticket)
+                self._cond.notify_all()
+                raise
+
+            for bucket, kind in self._buckets:
+                amount = 1 if kind == "requests" else tokens
+                bucket.level -= min(amount, bucket.capacity)
+            self._advance()
+            waited = time.monotonic() - start
+            self._waits.append(waited)
+            self.requests += 1
+            self.total_wait += waited
+            self._cond.notify_all()
+        return waited
+
+    def _advance(self):
+        # Next ticket, skipping abandoned ones. Call with _cond held.
+        self._serving += 1
+        while self._serving in self._abandoned:
+            self._abandoned.remove(self._serving)
+            self._serving += 1
+
+    async def acquire_async(self, tokens=1):
+        """
+        Async version of acquire (waits in a worker thread, keeping FIFO order).
+        """
+        return await asyncio.to_thread(self.acquire, tokens)
+
+    def stats(self):
+        """
+        Queue-wait metrics over the last 1000 requests.
+        """
+        with self._cond:
+            waits = sorted(self._waits)
+            queued = self._next_ticket - self._serving - len(self._abandoned)
+        pct = lambda p: round(waits[min(len(waits) - 1, int(p * len(waits)))], 3) if waits else 0.0
+        return {
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "requests": self.requests,
+            "queued": queued,
+            "total_wait_s": round(self.total_wait, 3),
+            "p50_wait_s": pct(0.50),
+            "p95_wait_s": pct(0.95),
+            "max_wait_s": round(waits[-1], 3) if waits else 0.0,
+        }
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_rate_limiter():
+    """
+    Returns the limiter shared by every ExcelAgent in this process.
+    Budgets come from GEMINI_RPM / GEMINI_TPM (0 = unlimited).
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter(
+                rpm=int(os.getenv("GEMINI_RPM", "60")),
+                tpm=int(os.getenv("GEMINI_TPM", "1000000")),
+            )
+        return _shared
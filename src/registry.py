@@ -0,0 +1,221 @@
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .profiles import PROFILE_COLUMNS, merge_profiles, format_schema
+from .changes import build_change_tables, describe_change_tables
+from .aliases import build_alias_index, describe_alias_index, add_group_columns
+from .warehouse import HAS_DUCKDB, SqlEngine
+from .prompts import SQL_CONTEXT
+
+class Dataset:
+    """
+    One immutable version of the loaded data and everything derived from it
+    (alias groups, partitions, week-over-week change tables, prompt context).
+    Built once per load/upload and then only read, so every session can share
+    the same instance.
+
+    The rows live either in `df` (one frame, partitions are row ranges) or in
+    a `store` that materializes frames on demand: a HistoryStore (validity
+    intervals) or a ParquetStore (one Parquet file per report date, queried
+    through `engine` when DuckDB is installed).
+    """
+    def __init__(self, version=0, files=None, load_errors=None, df=None, memory_report=None, store=None):
+        self.version = version
+        self.files = files or {}  # abspath -> file info + (size, mtime) signature + profile + row range in df
+        self.load_errors = load_errors or {}
+        self._df = df
+        self.store = store
+        self.storage = store.kind if store is not None else "frame"
+        self.engine = None  # SqlEngine over a ParquetStore
+        self.loaded = df is not None or store is not None
+        self.memory_report = memory_report or {}
+        self.schema_str = ""
+        self.values_str = ""
+        self.key_values = {}
+        self.data_version = ""
+        self.partitions = {}  # report_date -> (start, stop) row range in df (row count with a store)
+        self.changes = {}  # joiners / leavers / transitions between consecutive report dates
+        self.aliases = {}  # location_group / designation_group -> {raw value: canonical group}
+        self._dtypes = None
+        self.date_range = sorted(f['date'] for f in self.files.values()) if self.loaded else []
+        self.report_date = max(self.date_range) if self.date_range else None
+        self.latest_date = self.report_date
+        if self.loaded:
+            self.aliases = build_alias_index(merge_profiles([f['profile'] for f in self.files.values()])["ranked_values"])
+            if self._df is not None:
+                self._df = add_group_columns(self._df, self.aliases)
+            else:
+                empty = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in self.store.dtypes.items()})
+                self._dtypes = add_group_columns(empty, self.aliases).dtypes
+            self._build_partitions()
+            # Pairwise over a generator: at most two snapshots are held at once
+            self.changes = build_change_tables((d, self.snapshot(d)) for d in self.partitions)
+            if self.storage == "parquet" and HAS_DUCKDB:
+                self.engine = SqlEngine(self.store, self.dtypes.index, tables=self.changes, aliases=self.aliases)
+            self._prepare_context()
+
+    @property
+    def df(self):
+        """
+        The full multi-week frame. With a store it is materialized on every
+        access - prefer snapshot() for single dates.
+        """
+        if self.store is not None:
+            return add_group_columns(self.store.materialize(), self.aliases)
+        return self._df
+
+    @property
+    def dtypes(self):
+        return self._dtypes if self.store is not None else self._df.dtypes
+
+    def _build_partitions(self):
+        """
+        Indexes df (sorted by report_date) into one contiguous row range per date.
+        """
+        if self.store is not None:
+            self.partitions = {d: self.store.row_count(d) for d in self.store.dates}
+            return
+        dates = self._df['report_date'].to_numpy()
+        bounds = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(dates)]))
+        self.partitions = {
+            pd.Timestamp(dates[start]): (int(start), int(stop)) for start, stop in zip(starts, stops)
+        }
+
+    def snapshot(self, date=None):
+        """
+        Returns the rows of one report date (latest by default) as a slice of df.
+        """
+        if not self.partitions:
+            return None
+        date = max(self.partitions) if date is None else pd.Timestamp(date)
+        if self.store is not None:
+            return add_group_columns(self.store.snapshot(date), self.aliases)
+        if date not in self.partitions:
+            return self._df.iloc[0:0]
+        start, stop = self.partitions[date]
+        return self._df.iloc[start:stop]
+
+    def _prepare_context(self):
+        """
+        Creates schema and values strings for the prompt from the per-file
+        column profiles (no scan of the full multi-week frame).
+        """
+        merged = merge_profiles([f['profile'] for f in self.files.values()])
+
+        # Schema (dtypes after compaction, plus null counts / date ranges)
+        self.schema_str = format_schema(self.dtypes, merged)
+        if self.engine is not None:
+            self.schema_str += "\n" + SQL_CONTEXT
+
+        # Most frequent values for important categorical columns
+        values_list = []
+        self.key_values = {}  # Full (untruncated) value lists, used by the fast path
+
+        # Add available dates
+        if self.date_range:
+            dates = sorted([d.strftime('%Y-%m-%d') for d in self.date_range], reverse=True)
+            values_list.append(f"AVAILABLE REPORT DATES (YYYY-MM-DD): {dates}")
+            values_list.append(f"LATEST REPORT DATE: {max(dates)}")
+        if self.changes:
+            values_list.append(describe_change_tables(self.changes))
+        if self.aliases:
+            values_list.append(describe_alias_index(self.aliases))
+            for col, mapping in self.aliases.items():
+                self.key_values[col] = sorted(set(mapping.values()))
+
+        for col in PROFILE_COLUMNS:
+            if col in self.dtypes.index:
+                uniques = merged["ranked_values"].get(col, [])
+                self.key_values[col] = uniques
+                # Limit to top 20 to avoid token overflow
+                if len(uniques) > 20:
+                    uniques = uniques[:20] + ["..."]
+                values_list.append(f"{col}: {uniques}")
+        self.values_str = "\n".join(values_list)
+
+        # Fingerprint of everything the model sees about the data
+        self.data_version = hashlib.sha1((self.schema_str + self.values_str).encode("utf-8")).hexdigest()[:16]
+
+class DatasetRegistry:
+    """
+    Process-wide holder of the current Dataset for one data directory.
+
+    Readers just take `current` (a plain attribute read, so they always see a
+    complete version). Writers are serialized; each builds a new Dataset
+    from the current one and publishes it with a single reference swap.
+    Also hosts the other per-directory objects sessions should share
+    (code cache, few-shot index, execution workers).
+    """
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.current = Dataset()
+        self._write_lock = threading.RLock()
+        self._resources = {}
+        self._versioned = {}  # name -> (dataset version, object with close())
+        self._resources_lock = threading.Lock()
+
+    @contextmanager
+    def writer(self):
+        """
+        Serializes updates. Yields the dataset the update starts from.
+        """
+        with self._write_lock:
+            yield self.current
+
+    def publish(self, **state):
+        """
+        Builds the next version from `state` (see Dataset) and swaps it in.
+        """
+        with self._write_lock:
+            dataset = Dataset(version=self.current.version + 1, **state)
+            self.current = dataset
+        # Objects built for the previous version are done
+        with self._resources_lock:
+            stale = [name for name, (version, _) in self._versioned.items() if version != dataset.version]
+            closing = [self._versioned.pop(name)[1] for name in stale]
+        for obj in closing:
+            obj.close()
+        print(f"Published dataset version {dataset.version} for {self.data_dir}")
+        return dataset
+
+    def resource(self, name, factory):
+        """
+        Returns the shared object `name`, creating it with factory() on first use.
+        """
+        with self._resources_lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    def versioned_resource(self, name, dataset, factory):
+        """
+        Returns the shared object `name` for `dataset`, creating it with
+        factory(dataset) on first use. It is closed when a newer version is
+        published (a caller holding an older dataset gets the newer object).
+        """
+        with self._resources_lock:
+            entry = self._versioned.get(name)
+            if entry is None or entry[0] < dataset.version:
+                if entry is not None:
+                    entry[1].close()
+                entry = (dataset.version, factory(dataset))
+                self._versioned[name] = entry
+            return entry[1]
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry(data_dir):
+    """
+    Returns the registry shared by every ExcelAgent on `data_dir` in this process.
+    """
+    key = os.path.abspath(data_dir)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = DatasetRegistry(data_dir)
+        return _registries[key]
@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+
+def _ngrams(text, n=3):
+    """
+    Character n-grams of the normalized text, padded so word edges count.
+    """
+    text = " " + " ".join(re.findall(r"[a-z0-9]+", text.lower())) + " "
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+class FewShotIndex:
+    """
+    Character n-gram TF-IDF index over question -> code examples.
+
+    Questions are stored as postings (n-gram -> {example id: term count}), so a
+    query only touches examples that share an n-gram with it. Examples can be
+    added at any time; IDF weights and example norms are recomputed lazily on
+    the next search after an insert.
+    """
+    def __init__(self, examples=(), n=3, path=None):
+        self.n = n
+        self.path = path
+        self.examples = []  # [{"q": ..., "code": ...}]
+        self._ids = {}  # normalized question -> example id
+        self._postings = defaultdict(dict)
+        self._idf = {}
+        self._norms = []
+        self._dirty = True
+        self._lock = threading.Lock()
+        for ex in examples:
+            self._insert(ex["q"], ex["code"])
+
+    @classmethod
+    def load(cls, path, seed=(), n=3):
+        """
+        Builds an index from the seed examples plus the ones saved at `path`.
+        """
+        index = cls(seed, n=n, path=path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for ex in json.load(f).get("examples", []):
+                    index._insert(ex["q"], ex["code"], harvested=True)
+        except (OSError, ValueError):
+            pass
+        return index
+
+    def _insert(self, question, code, harvested=False):
+        key = " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+        if key in self._ids:
+            return False
+        doc_id = len(self.examples)
+        self._ids[key] = doc_id
+        self.examples.append({"q": question, "code": code, "harvested": harvested})
+        for gram, count in _ngrams(question, self.n).items():
+            self._postings[gram][doc_id] = count
+        self._dirty = True
+        return True
+
+    def add(self, question, code):
+        """
+        Adds a validated question -> code pair and persists it.
+        Returns False if the question is already indexed.
+        """
+        with self._lock:
+            added = self._insert(question, code, harvested=True)
+        if added and self.path:
+            self.save()
+        return added
+
+    def _reweight(self):
+        total = len(self.examples)
+        self._idf = {g: math.log((total + 1) / (len(docs) + 1)) + 1 for g, docs in self._postings.items()}
+        norms = [0.0] * total
+        for gram, docs in self._postings.items():
+            idf = self._idf[gram]
+            for doc_id, count in docs.items():
+                norms[doc_id] += (count * idf) ** 2
+        self._norms = [math.sqrt(x) for x in norms]
+        self._dirty = False
+
+    def search(self, query, k=3):
+        """
+        Returns up to k (question, code, cosine score) tuples, best first.
+        """
+        with self._lock:
+            if self._dirty:
+                self._reweight()
+            scores = defaultdict(float)
+            q_norm = 0.0
+            unseen_idf = math.log(len(self.examples) + 1) + 1
+            for gram, count in _ngrams(query, self.n).items():
+                idf = self._idf.get(gram)
+                q_weight = count * (idf or unseen_idf)
+                q_norm += q_weight ** 2
+                if idf is None:
+                    continue
+                for doc_id, d_count in self._postings[gram].items():
+                    scores[doc_id] += q_weight * d_count * idf
+            if not scores:
+                return []
+            q_norm = math.sqrt(q_norm)
+            ranked = sorted(
+                ((score / (q_norm * self._norms[doc_id]), doc_id) for doc_id, score in scores.items()),
+                reverse=True,
+            )[:k]
+        return [(self.examples[d]["q"], self.examples[d]["code"], s) for s, d in ranked]
+
+    def save(self, path=None):
+        """
+        Writes the harvested examples (the seed library lives in code).
+        """
+        path = path or self.path
+        with self._lock:
+            harvested = [{"q": ex["q"], "code": ex["code"]} for ex in self.examples if ex["harvested"]]
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"n": self.n, "examples": harvested}, f)
+            os.replace(tmp_path, path)
@@ -0,0 +1,220 @@
+import os
+import queue
+import threading
+import traceback
+import multiprocessing
+from collections.abc import Mapping
+from .tracing import profile_exec
+
+class LazyVars(dict):
+    """
+    Sandbox namespace whose expensive entries are built on first use.
+
+    `loaders` maps names to zero-argument functions. exec() looks names up
+    through __getitem__ when its locals aren't an exact dict, so code that
+    never mentions e.g. `df` never materializes it.
+    """
+    def __init__(self, values=(), loaders=None):
+        super().__init__(values)
+        self.loaders = dict(loaders or {})
+
+    def __missing__(self, key):
+        if key in self.loaders:
+            value = self[key] = self.loaders[key]()
+            return value
+        raise KeyError(key)
+
+    def copy(self):
+        return LazyVars(self, self.loaders)
+
+class LazyFrames(Mapping):
+    """
+    Read-only date -> DataFrame mapping that builds each frame when accessed.
+    """
+    def __init__(self, keys, load):
+        self._keys = list(keys)
+        self._load = load
+        self._frames = {}
+
+    def __getitem__(self, key):
+        if key not in self._frames:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._frames[key] = self._load(key)
+        return self._frames[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+def fork_available():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+def _limit_memory(memory_mb):
+    """
+    Caps the worker's address space at its current size + memory_mb.
+    (Linux only - silently skipped elsewhere.)
+    """
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        limit = current + memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, OSError, ValueError):
+        pass
+
+def _worker_main(conn, base_vars, memory_mb):
+    """
+    Worker loop: receives code, execs it against the inherited (copy-on-write)
+    sandbox variables and sends back (result, explanation, profile text or None).
+    """
+    # Pre-warm the plotting stack once instead of on every call
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import plotly.express as px
+
+    _limit_memory(memory_mb)
+    base_vars = base_vars.copy()
+    base_vars.update(plt=plt, px=px)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        code, profile = message
+
+        local_vars = base_vars.copy()
+        local_vars.update(result=None, explanation=None)
+        profile_text = None
+        try:
+            if profile:
+                profile_text = profile_exec(code, local_vars)
+            else:
+                exec(code, {}, local_vars)
+            reply = (local_vars.get("result", "No result found"), local_vars.get("explanation", "No explanation provided."), profile_text)
+        except MemoryError:
+            reply = ("Error: Code exceeded the memory limit for generated code.", None, None)
+        except Exception as e:
+            reply = (f"Error: {str(e)}", None, None)
+
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send((f"Error: Result could not be returned ({type(e).__name__}: {e})", None, None))
+        finally:
+            plt.close("all")
+
+class _Worker:
+    def __init__(self, ctx, base_vars, memory_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, base_vars, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=5)
+        finally:
+            self.conn.close()
+
+class ExecutionPool:
+    """
+    Pool of pre-forked processes for running generated code.
+
+    Workers are forked after the data is loaded, so they share the parent's
+    DataFrame pages copy-on-write instead of receiving a pickled copy per call.
+    Each execution gets a wall-clock timeout (the worker is killed and
+    replaced) and each worker a memory cap. Requires the 'fork' start method.
+
+    One pool serves every session on a dataset version (see
+    DatasetRegistry.versioned_resource); close() shuts idle workers down
+    at once and busy ones when their execution returns.
+    """
+    def __init__(self, base_vars, workers=2, timeout=30, memory_mb=2048, version=None):
+        self.ctx = multiprocessing.get_context("fork")
+        self.base_vars = base_vars
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.version = version
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(max(1, workers)):
+            self._spawn()
+
+    def _spawn(self):
+        worker = _Worker(self.ctx, self.base_vars, self.memory_mb)
+        with self._lock:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _retire(self, worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        try:
+            worker.conn.send(None)
+        except (OSError, BrokenPipeError):
+            pass
+        worker.kill()
+
+    def _replace(self, worker):
+        self._retire(worker)
+        if not self._closed:
+            self._spawn()
+
+    def _release(self, worker):
+        if self._closed:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+
+    def execute(self, code, profile=False):
+        """
+        Runs code in an idle worker. Returns (result, explanation, profile)
+        where profile is the cProfile summary when requested, else None
+        when the pool has been closed (the caller should get the current one).
+        """
+        worker = self._idle.get()
+        if worker is None:
+            # Closed: wake the next waiter too
+            self._idle.put(None)
+            return None
+        try:
+            worker.conn.send((code, profile))
+            if not worker.conn.poll(self.timeout):
+                self._replace(worker)
+                return f"Error: Execution timed out after {self.timeout}s.", None, None
+            reply = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError):
+            # Worker died (e.g. killed by the OS)
+            self._replace(worker)
+            return "Error: Execution worker crashed.", None, None
+        except Exception as e:
+            self._replace(worker)
+            return f"Error: {traceback.format_exception_only(type(e), e)[-1].strip()}", None, None
+        self._release(worker)
+        return reply
+
+    def close(self):
+        self._closed = True
+        idle = []
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if worker is not None:
+                idle.append(worker)
+        self._idle.put(None)
+        for worker in idle:
+            self._retire(worker)
@@ -0,0 +1,33 @@
+import threading
+from collections import OrderedDict
+
+class SnapshotCache:
+    """
+    Small LRU of single-date frames for the stores that materialize them on
+    demand (HistoryStore, ParquetStore). Callers get a shallow
+    (copy-on-write) copy so they can't modify the cached frame.
+    """
+    def __init__(self, size=4):
+        self.size = size
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, date, build):
+        """
+        Frame for `date`, built with build(date) on a miss.
+        """
+        with self._lock:
+            cached = self._frames.get(date)
+            if cached is not None:
+                self._frames.move_to_end(date)
+                return cached.copy(deep=False)
+        frame = build(date)
+        with self._lock:
+            self._frames[date] = frame
+            while len(self._frames) > self.size:
+                self._frames.popitem(last=False)
+        return frame.copy(deep=False)
+
+    def memory_mb(self):
+        with self._lock:
+            return sum(f.memory_usage(deep=True).sum() for f in self._frames.values()) / (1024 * 1024)
@@ -0,0 +1,166 @@
+import os
+import io
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import logging
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def describe_result(result):
+    """
+    Type and size of an execution result, for trace records.
+    """
+    info = {"result_type": type(result).__name__}
+    if hasattr(result, "shape"):
+        info["result_size"] = list(result.shape)
+    elif isinstance(result, (str, list, tuple, dict)):
+        info["result_size"] = len(result)
+    return info
+
+def profile_exec(code, local_vars, top=15):
+    """
+    Runs exec(code) under cProfile and returns the top functions by
+    cumulative time as text. Exceptions from the code propagate as usual.
+    """
+    profiler = cProfile.Profile()
+    profiler.runctx(code, {}, local_vars)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    return out.getvalue()
+
+class Tracer:
+    """
+    Structured latency spans for the question pipeline.
+
+    Each span is one JSON line (trace id, parent span, stage, duration and
+    whatever attributes the stage records) in a rotating log file, and its
+    duration is kept in a per-stage window for the p50/p95 metrics panel.
+    Spans nest through a context variable, so they follow a question across
+    threads (asyncio.to_thread) and coroutines.
+    """
+    def __init__(self, path=None, max_bytes=5 * 1024 * 1024, backups=3, window=1000):
+        self.path = path
+        self._durations = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._logger = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._logger = logging.getLogger(f"agent.trace.{os.path.abspath(path)}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger.addHandler(handler)
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """
+        Times the enclosed block. Yields the span's attribute dict, so the
+        stage can add sizes, hit flags etc. while it runs.
+        """
+        parent = _current_span.get()
+        record = {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:12],
+            "span_id": uuid.uuid4().hex[:8],
+            "parent_id": parent["span_id"] if parent else None,
+            "stage": stage,
+            "ts": round(time.time(), 3),
+        }
+        record.update(attrs)
+        token = _current_span.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.emit(record)
+
+    def current(self):
+        """
+        Attributes of the innermost open span (None outside a span).
+        """
+        return _current_span.get()
+
+    def event(self, stage, duration_s, **attrs):
+        """
+        Records an already-measured interval (e.g. a backoff sleep) as a span.
+        """
+        parent = _current_span.get()
+        record = {
+            "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:12],
+            "span_id": uuid.uuid4().hex[:8],
+            "parent_id": parent["span_id"] if parent else None,
+            "stage": stage,
+            "ts": round(time.time(), 3),
+            "duration_ms": round(duration_s * 1000, 3),
+        }
+        record.update(attrs)
+        self.emit(record)
+
+    def emit(self, record):
+        with self._lock:
+            self._durations[record["stage"]].append(record["duration_ms"])
+        if self._logger is not None:
+            self._logger.info(json.dumps(record, default=str))
+
+    def stats(self):
+        """
+        Per-stage latency over the recent window: {stage: {count, p50_ms, p95_ms, max_ms}}.
+        """
+        with self._lock:
+            windows = {stage: sorted(d) for stage, d in self._durations.items()}
+        pct = lambda values, p: values[min(len(values) - 1, int(p * len(values)))]
+        return {
+            stage: {
+                "count": len(values),
+                "p50_ms": round(pct(values, 0.50), 1),
+                "p95_ms": round(pct(values, 0.95), 1),
+                "max_ms": round(values[-1], 1),
+            }
+            for stage, values in windows.items() if values
+        }
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_tracer():
+    """
+    Returns the tracer shared by every ExcelAgent in this process.
+    The log path comes from AGENT_TRACE_LOG (empty = metrics only, no file).
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Tracer(path=os.getenv("AGENT_TRACE_LOG", os.path.join("logs", "agent_trace.jsonl")) or None)
+        return _shared
+
+def trace_backoff(retry_state):
+    """
+    tenacity before_sleep hook: counts the retry on the open span and records
+    the backoff sleep as its own 'gemini_backoff' span.
+    """
+    sleep = retry_state.next_action.sleep if retry_state.next_action else 0.0
+    span = _current_span.get()
+    if span is not None:
+        span["retries"] = span.get("retries", 0) + 1
+        span["backoff_s"] = round(span.get("backoff_s", 0.0) + sleep, 3)
+    error = retry_state.outcome.exception() if retry_state.outcome else None
+    get_tracer().event("gemini_backoff", sleep, attempt=retry_state.attempt_number,
+                       error=type(error).__name__ if error else None)
@@ -68,3 +68,34 @@ def get_all_files(directory):
     if files:
         files.sort(key=lambda x: x['date'], reverse=True)
     return files
+
+def file_signature(path):
+    """
+    Returns a cheap (size, mtime_ns) signature used to detect changed files.
+    """
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def extract_code(text):
+    """
+    Pulls Python code out of a (possibly partial) model response.
+    Returns (code, complete) where complete is True once a fenced block has
+    been closed - anything the model says after it can be ignored.
+    """
+    stripped = text.lstrip()
+    if not stripped.startswith("```"):
+        # Model followed the "no markdown" rule - the whole text is code
+        return text.strip(), False
+
+    body = stripped[3:]
+    newline = body.find("\n")
+    if newline == -1:
+        # Still receiving the opening fence line (e.g. "```pyth")
+        return "", False
+    body = body[newline + 1:]
+
+    end = body.find("```")
+    if end == -1:
+        # Hide a half-received closing fence
+        return body.strip().rstrip("`").rstrip(), False
+    return body[:end].strip(), True
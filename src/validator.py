@@ -0,0 +1,292 @@
+import re
+import ast
+import difflib
+
+# Names the sandbox binds to dict-like containers of frames (date -> DataFrame)
+FRAME_MAPPINGS = {'partitions'}
+
+# Methods whose result keeps the columns of the frame they're called on
+ROW_METHODS = {'copy', 'query', 'head', 'tail', 'dropna', 'drop_duplicates', 'sort_values', 'sample', 'nlargest', 'nsmallest'}
+
+# Methods taking column names as the first argument / `by` / `subset`
+COLUMN_METHODS = {'groupby': 'by', 'sort_values': 'by', 'drop_duplicates': 'subset', 'dropna': 'subset'}
+
+LANGUAGE_TAG = re.compile(r"^\s*(python3?|py)\s*$", re.IGNORECASE)
+
+def _norm(name):
+    """
+    Comparison key for trivial mismatches: case, spacing and punctuation.
+    """
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(name).lower()).split())
+
+def _unique_match(value, candidates):
+    matches = [c for c in candidates if _norm(c) == _norm(value)]
+    return matches[0] if len(matches) == 1 else None
+
+def _str_const(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+def _str_items(node):
+    """
+    String constants in a column selector: 'a' or ['a', 'b'].
+    """
+    if _str_const(node):
+        return [node]
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return [e for e in node.elts if _str_const(e)]
+    return []
+
+class CodeCheck:
+    """
+    Outcome of validate_code: the (possibly auto-fixed) code, the fixes
+    applied, and the problems that need the model.
+    """
+    def __init__(self, code, fixes=None, problems=None, warnings=None, value_columns=None):
+        self.code = code
+        self.fixes = fixes or []
+        self.problems = problems or []
+        self.warnings = warnings or []
+        self.value_columns = value_columns or set()  # columns whose valid values the repair prompt should list
+
+    @property
+    def ok(self):
+        return not self.problems
+
+def strip_fences(code):
+    """
+    Removes markdown left over after _clean_code: a bare language tag line
+    (e.g. from ```py) and stray ``` lines.
+    """
+    lines = code.strip().splitlines()
+    kept = [line for line in lines if line.strip() != "```" and not line.strip().startswith("```")]
+    if kept and LANGUAGE_TAG.match(kept[0]):
+        kept = kept[1:]
+    return "\n".join(kept).strip()
+
+class _Checker(ast.NodeVisitor):
+    """
+    Collects column references and filter literals on known frames.
+    """
+    def __init__(self, frames, key_values):
+        self.frames = frames  # name -> column list
+        self.key_values = key_values
+        self.aliases = {}  # variable -> column list of the frame it's a row subset of
+        self.created = set()  # columns the code assigns itself
+        self.assigned = set()  # every variable name stored to
+        self.column_refs = []  # (const node, frame columns)
+        self.value_refs = []  # (const node, column const node)
+
+    # 1. Which names are frames
+    def frame_columns(self, node):
+        if isinstance(node, ast.Name):
+            if node.id in self.aliases:
+                return self.aliases[node.id]
+            return self.frames.get(node.id) if node.id not in FRAME_MAPPINGS else None
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id in FRAME_MAPPINGS:
+            return self.frames.get(node.value.id)
+        # Inline row filters: df[mask]['col'], df.loc[mask].groupby(...)
+        if isinstance(node, (ast.Subscript, ast.Call)):
+            return self.row_subset_of(node)
+        return None
+
+    def row_subset_of(self, node):
+        """
+        Columns of `node` when it is a row filter/reorder of a known frame.
+        """
+        if isinstance(node, ast.Subscript):
+            base = self.frame_columns(node.value)
+            if base is not None and not _str_items(node.slice):
+                return base
+            # df.loc[mask] / df.iloc[...] without a column part
+            if isinstance(node.value, ast.Attribute) and node.value.attr in ('loc', 'iloc') and not isinstance(node.slice, ast.Tuple):
+                return self.frame_columns(node.value.value)
+            return None
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ROW_METHODS:
+            return self.frame_columns(node.func.value)
+        return self.frame_columns(node) if isinstance(node, ast.Name) else None
+
+    def column_ref(self, node):
+        """
+        (const node, frame columns) when `node` is frame['col'].
+        """
+        if isinstance(node, ast.Subscript) and _str_const(node.slice):
+            columns = self.frame_columns(node.value)
+            if columns is not None:
+                return node.slice, columns
+        return None
+
+    def collect_aliases(self, tree):
+        # A variable counts as a frame only if every assignment to it is a row subset of one
+        candidates = {}
+        plain = set()  # Name nodes that are the only target of `name = value`
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                candidates.setdefault(node.targets[0].id, []).append(node.value)
+                plain.add(id(node.targets[0]))
+        for node in ast.walk(tree):
+            # Unpacking, loops, augmented assignment, with/as, comprehensions...
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store) and id(node) not in plain:
+                candidates.setdefault(node.id, []).append(None)
+        self.assigned = set(candidates)
+        changed = True
+        while changed:
+            changed = False
+            for name, values in candidates.items():
+                if name in self.aliases or any(v is None for v in values):
+                    continue
+                columns = [self.row_subset_of(v) for v in values]
+                if columns and all(c is not None for c in columns) and all(c is columns[0] for c in columns):
+                    self.aliases[name] = columns[0]
+                    changed = True
+        # Frame names the code rebinds to something else are no longer the sandbox frames
+        self.frames = {k: v for k, v in self.frames.items() if k not in candidates or k in self.aliases}
+
+    # 2. References
+    def visit_Subscript(self, node):
+        if isinstance(node.ctx, ast.Store):
+            for const in _str_items(node.slice):
+                self.created.add(const.value)
+        else:
+            columns = self.frame_columns(node.value)
+            if columns is not None:
+                for const in _str_items(node.slice):
+                    self.column_refs.append((const, columns))
+            # df.loc[rows, 'col'] / df.loc[rows, ['a', 'b']]
+            elif (isinstance(node.value, ast.Attribute) and node.value.attr == 'loc'
+                  and isinstance(node.slice, ast.Tuple) and len(node.slice.elts) == 2):
+                columns = self.frame_columns(node.value.value)
+                if columns is not None:
+                    for const in _str_items(node.slice.elts[1]):
+                        self.column_refs.append((const, columns))
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Attribute):
+            method = node.func.attr
+            columns = self.frame_columns(node.func.value)
+            if columns is not None and method in COLUMN_METHODS:
+                selector = node.args[0] if node.args else None
+                for kw in node.keywords:
+                    if kw.arg == COLUMN_METHODS[method]:
+                        selector = kw.value
+                if selector is not None:
+                    for const in _str_items(selector):
+                        self.column_refs.append((const, columns))
+            if method == 'assign':
+                self.created.update(kw.arg for kw in node.keywords if kw.arg)
+            # df['col'].isin([...])
+            ref = self.column_ref(node.func.value)
+            if method == 'isin' and ref is not None and node.args:
+                for const in _str_items(node.args[0]):
+                    self.value_refs.append((const, ref[0]))
+        self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        # df['col'] == 'value' (either side)
+        if len(node.ops) == 1 and isinstance(node.ops[0], (ast.Eq, ast.NotEq)):
+            left, right = node.left, node.comparators[0]
+            for ref_node, const in ((left, right), (right, left)):
+                ref = self.column_ref(ref_node)
+                if ref is not None and _str_const(const):
+                    self.value_refs.append((const, ref[0]))
+        self.generic_visit(node)
+
+def _rewrite(code, replacements):
+    """
+    Replaces single-line string constants in the source (keeps formatting
+    and comments, unlike ast.unparse). `replacements` is [(node, new value)].
+    """
+    lines = code.splitlines(keepends=True)
+    for node, value in sorted(replacements, key=lambda r: (r[0].lineno, r[0].col_offset), reverse=True):
+        if node.lineno != node.end_lineno:
+            continue
+        # Offsets are in UTF-8 bytes
+        line = lines[node.lineno - 1].encode("utf-8")
+        line = line[:node.col_offset] + repr(value).encode("utf-8") + line[node.end_col_offset:]
+        lines[node.lineno - 1] = line.decode("utf-8")
+    return "".join(lines)
+
+def validate_code(code, frames, key_values=None):
+    """
+    Static checks on generated code before it runs.
+
+    `frames` maps the sandbox's frame names to their columns (a name in
+    FRAME_MAPPINGS maps to the columns of its values); `key_values` maps
+    columns to their valid values. Finds syntax errors, a missing `result`
+    / `explanation`, unknown columns and filter values that don't exist.
+    Trivial issues (leftover fences, column or value names off by case,
+    spacing or punctuation) are fixed in place; the rest are returned as
+    problems for a repair prompt. A filter value with no close spelling
+    among the known values is only a warning: the data may simply not
+    contain it ('How many Architects?' -> 0), and a repair would swap in a
+    different value.
+    """
+    key_values = key_values or {}
+    fixes, problems, warnings = [], [], []
+
+    # 1. Leftover markdown
+    cleaned = strip_fences(code)
+    if cleaned != code.strip():
+        fixes.append("stripped leftover markdown fence")
+    code = cleaned
+
+    # 2. Syntax
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return CodeCheck(code, fixes, [f"SyntaxError: {e.msg} (line {e.lineno})"])
+
+    checker = _Checker(dict(frames), key_values)
+    checker.collect_aliases(tree)
+    checker.visit(tree)
+
+    # 3. Output variables
+    if 'result' not in checker.assigned:
+        problems.append("The code never assigns `result`.")
+    if 'explanation' not in checker.assigned:
+        warnings.append("The code never assigns `explanation`.")
+
+    # 4. Columns
+    replacements = []
+    for const, columns in checker.column_refs:
+        name = const.value
+        if name in columns or name in checker.created:
+            continue
+        match = _unique_match(name, list(columns) + sorted(checker.created))
+        if match is not None:
+            replacements.append((const, match))
+            fixes.append(f"column '{name}' -> '{match}'")
+        else:
+            close = difflib.get_close_matches(name, [str(c) for c in columns], n=3, cutoff=0.6)
+            hint = f" Did you mean: {close}?" if close else ""
+            problems.append(f"Unknown column '{name}' (line {const.lineno}).{hint}")
+    fixed_columns = {id(node): value for node, value in replacements}
+
+    # 5. Filter values on columns with a known value list
+    value_columns = set()
+    missing_values = []
+    for const, column_node in checker.value_refs:
+        column = fixed_columns.get(id(column_node), column_node.value)
+        values = key_values.get(column)
+        if not values or not all(isinstance(v, str) for v in values) or const.value in values:
+            continue
+        match = _unique_match(const.value, values)
+        if match is not None:
+            replacements.append((const, match))
+            fixes.append(f"{column} value '{const.value}' -> '{match}'")
+        else:
+            close = difflib.get_close_matches(const.value, values, n=3, cutoff=0.6)
+            if close:
+                # Likely a misspelling
+                problems.append(f"'{const.value}' is not a value of `{column}` (line {const.lineno}). Did you mean: {close}?")
+                value_columns.add(column)
+            else:
+                missing_values.append(f"'{const.value}' is not a value of `{column}` (line {const.lineno}).")
+
+    if replacements:
+        code = _rewrite(code, replacements)
+    if problems:
+        # Worth fixing too while the model is rewriting anyway
+        problems += warnings
+        warnings = []
+    return CodeCheck(code, fixes, problems, warnings + missing_values, value_columns)
@@ -0,0 +1,180 @@
+import os
+import uuid
+import threading
+import numpy as np
+import pandas as pd
+from .compact import categorize_frames, compact_concat, downcast_numerics, normalize_ids
+from .aliases import GROUP_COLUMNS
+from .snapshots import SnapshotCache
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+class ParquetStore:
+    """
+    Weekly reports persisted as one Parquet file per report date, in
+    hive-style directories (`report_date=YYYY-MM-DD/part-<version>.parquet`),
+    so a query engine can skip whole weeks by their date.
+
+    A store object is one immutable version: updates write new files and
+    return a new store, leaving the files of this one in place for readers
+    that still hold it. Only files this store's own earlier versions wrote
+    are ever deleted, so processes sharing the directory (the app and a
+    batch run) don't remove each other's partitions. Single-date snapshots
+    and the full multi-week frame are read back on demand with the original
+    column layout.
+    """
+    kind = "parquet"
+
+    def __init__(self, root, files=None, columns=None, dtypes=None, snapshot_cache=4):
+        self.root = os.path.abspath(root)
+        self.files = dict(files or {})  # pd.Timestamp -> parquet path
+        self.dates = sorted(self.files)
+        self.columns = columns or []  # column order of the materialized frames
+        self.dtypes = dtypes
+        self.superseded = set()  # files of the previous version that this one dropped
+        self._rows = {}
+        self._snapshots = SnapshotCache(snapshot_cache)
+
+    def _write(self, date, frame, version):
+        folder = os.path.join(self.root, f"report_date={date.strftime('%Y-%m-%d')}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{version}.parquet")
+        # report_date comes from the directory name; categoricals round-trip through the pandas metadata
+        frame = frame.drop(columns=['report_date'], errors='ignore').reset_index(drop=True)
+        frame = normalize_ids(downcast_numerics(categorize_frames([frame])[0]))
+        frame.to_parquet(path, index=False)
+        return path
+
+    def updated(self, frames, dates):
+        """
+        Returns the next version: `frames` ({report_date: frame}) written as
+        new partitions, other dates in `dates` kept from this version, dates
+        not in `dates` dropped. Files of the previous version that neither
+        this version nor the new one references are deleted.
+        """
+        version = uuid.uuid4().hex[:12]
+        frames = {pd.Timestamp(d): frame for d, frame in frames.items()}
+        dates = {pd.Timestamp(d) for d in dates}
+        files = {d: p for d, p in self.files.items() if d in dates and d not in frames}
+        columns = list(self.columns)
+        dtypes = self.dtypes
+        for date, frame in sorted(frames.items()):
+            files[date] = self._write(date, frame, version)
+            columns += [c for c in frame.columns if c not in columns]
+        if frames:
+            # Stored dtypes, as read back
+            import pyarrow.parquet as pq
+            latest = max(frames)
+            dtypes = pq.read_schema(files[latest]).empty_table().to_pandas().dtypes
+            if 'report_date' in frames[latest].columns:
+                dtypes['report_date'] = frames[latest]['report_date'].dtype
+            dtypes = dtypes.reindex(columns, fill_value=np.dtype(object))
+        store = ParquetStore(self.root, files, columns, dtypes)
+        store.superseded = set(self.files.values()) - set(files.values())
+        # The version before this one is no longer served
+        self._remove(self.superseded - set(files.values()))
+        return store
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def row_count(self, date):
+        date = pd.Timestamp(date)
+        if date not in self._rows:
+            import pyarrow.parquet as pq
+            self._rows[date] = pq.ParquetFile(self.files[date]).metadata.num_rows if date in self.files else 0
+        return self._rows[date]
+
+    def _read(self, date):
+        frame = pd.read_parquet(self.files[date])
+        if 'report_date' in self.columns:
+            dtype = self.dtypes['report_date'] if self.dtypes is not None else 'datetime64[us]'
+            frame.insert(min(self.columns.index('report_date'), len(frame.columns)), 'report_date',
+                         pd.Series(date, index=frame.index).astype(dtype))
+        return frame
+
+    def snapshot(self, date):
+        """
+        Rows of one report date, read from its partition (recent dates come
+        from the snapshot cache).
+        """
+        date = pd.Timestamp(date)
+        if date not in self.files:
+            return pd.DataFrame(columns=self.columns)
+        return self._snapshots.get(date, self._read)
+
+    def materialize(self):
+        """
+        The full multi-week frame (oldest report first), read from every
+        partition on each call.
+        """
+        if not self.dates:
+            return pd.DataFrame(columns=self.columns)
+        return compact_concat([self._read(d) for d in self.dates])[0]
+
+    def memory_mb(self):
+        # Only the snapshot cache lives in memory
+        return self._snapshots.memory_mb()
+
+    def disk_mb(self):
+        return sum(os.path.getsize(p) for p in self.files.values() if os.path.exists(p)) / (1024 * 1024)
+
+class SqlEngine:
+    """
+    DuckDB over a ParquetStore for generated code: `query(sql)` returns a
+    pandas DataFrame.
+
+    Views: `tracker` (every report, same columns as df including the alias
+    group columns; `report_date` comes from the partition path, so filters
+    on it only read the matching files) and the change tables `joiners`,
+    `leavers`, `transitions`. Connections are opened per thread and
+    process, so forked exec workers get their own.
+    """
+    def __init__(self, store, columns, tables=None, aliases=None):
+        self.store = store
+        self.columns = list(columns)
+        self.tables = tables or {}
+        self.aliases = aliases or {}
+        self._local = threading.local()
+
+    def _connect(self):
+        con = duckdb.connect(":memory:")
+        files = ", ".join("'" + self.store.files[d].replace("'", "''") + "'" for d in self.store.dates)
+        con.execute(
+            f"CREATE VIEW tracker_raw AS SELECT * FROM read_parquet([{files}], hive_partitioning = true, union_by_name = true)"
+        )
+        joins, select = [], []
+        for col in self.columns:
+            if col in GROUP_COLUMNS and col in self.aliases:
+                # Raw value -> canonical group, as in the pandas frames
+                table = f"{col}_map"
+                con.register(table, pd.DataFrame(list(self.aliases[col].items()), columns=['raw', 'grp']))
+                joins.append(f'LEFT JOIN {table} ON t."{GROUP_COLUMNS[col]}" = {table}.raw')
+                select.append(f'{table}.grp AS "{col}"')
+            else:
+                select.append(f't."{col}"')
+        con.execute(f"CREATE VIEW tracker AS SELECT {', '.join(select)} FROM tracker_raw t {' '.join(joins)}")
+        for name, table in self.tables.items():
+            con.register(name, table)
+        return con
+
+    def connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.con = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.con
+
+    def query(self, sql, params=None):
+        """
+        Runs `sql` and returns the result as a pandas DataFrame.
+        """
+        return self.connection().execute(sql, params or []).df()